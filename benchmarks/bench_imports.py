@@ -0,0 +1,97 @@
+#!/usr/bin/python
+"""
+Benchmark of the time taken to import the entry point and pipeline modules.
+Each module is imported in a fresh interpreter, the best of several runs is
+kept and modules that should only be imported when needed are reported if
+they were loaded. Results are compared against a baseline file (written on the
+first run or with --update-baseline) and regressions beyond the threshold fail
+the run. Baselines are machine dependent so they are not committed.
+
+    python benchmarks/bench_imports.py
+
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from os.path import exists, join
+
+MODULES = (
+    "hdx.scraper.unhcr.microdata.__main__",
+    "hdx.scraper.unhcr.microdata.pipeline",
+)
+
+# Imported on first use rather than at startup
+DEFERRED = (
+    "hdx.api.configuration",
+    "hdx.data.dataset",
+    "hdx.location.country",
+    "dateutil.parser",
+    "slugify",
+    "frictionless",
+)
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+print(json.dumps({{"duration": duration, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module, repeat):
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT.format(module=module)],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        result = json.loads(output)
+        if best is None or result["duration"] < best["duration"]:
+            best = result
+    loaded = [x for x in DEFERRED if x in best["modules"]]
+    return best["duration"], loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--baseline", default=join("benchmarks", "baseline_imports.json")
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = dict()
+    failed = list()
+    for module in MODULES:
+        duration, loaded = measure(module, args.repeat)
+        results[module] = duration
+        print(f"{module:>40}: {duration:8.4f}s")
+        if loaded:
+            print(f"{'':>40}  imports {', '.join(loaded)} at startup")
+            failed.append(module)
+    if args.update_baseline or not exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for module, duration in results.items():
+            previous = baseline.get(module)
+            if previous and (duration - previous) / previous > args.threshold:
+                print(f"{module} regressed from {previous:.4f}s to {duration:.4f}s")
+                failed.append(module)
+    if failed:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+#!/usr/bin/python
+"""
+Benchmark of Pipeline.get_dataset_info and Pipeline.generate_dataset at catalog
+scale. Thousands of study documents are synthesised from the fixtures in
+tests/fixtures by varying nations, topics, keywords and date formats. Timings
+are broken down by stage and peak memory of a full generation pass is tracked.
+Results are compared against a baseline file (written on the first run or with
+--update-baseline) and regressions beyond the threshold fail the run. Baselines
+are machine dependent so they are not committed.
+
+    python benchmarks/bench_pipeline.py --studies 2000
+
+"""
+
+import argparse
+import copy
+import json
+import random
+import sys
+import time
+import tracemalloc
+from os.path import exists, join
+
+from hdx.api.configuration import Configuration
+from hdx.api.locations import Locations
+from hdx.data.vocabulary import Vocabulary
+from hdx.location.country import Country
+from hdx.scraper.unhcr.microdata import decode
+from hdx.scraper.unhcr.microdata.countries import CountryResolver
+from hdx.scraper.unhcr.microdata.dates import get_collection_period, parse_date
+from hdx.scraper.unhcr.microdata.decode import decode_metadata
+from hdx.scraper.unhcr.microdata.httpcache import CachedResponse
+from hdx.scraper.unhcr.microdata.pipeline import Pipeline
+from hdx.scraper.unhcr.microdata.tags import get_tags, tokenize_tags
+from hdx.utilities.loader import load_json
+from hdx.utilities.saver import save_json
+
+TOPICS = [
+    "Protection",
+    "Livelihood & Social cohesion",
+    "Food security",
+    "Emergency Shelter and NFI",
+    "Housing, Land and Property",
+    "Domestic Needs/Household Support",
+    "Gender Based Violence",
+    "Mental Health",
+    "Health and other",
+    "Education",
+    "Water, Sanitation and Hygiene",
+    "Cash Assistance",
+]
+KEYWORDS = [
+    "Refugees",
+    "Asylum seekers",
+    "Forced displacement",
+    "Conflict",
+    "Internally displaced persons",
+    "Stateless persons",
+    "Returnees",
+    "Host communities",
+]
+DATE_FORMATS = [
+    ("%Y-%m-%d", "%Y-%m-%d"),
+    ("%Y-%m", "%Y-%m"),
+    ("%Y", "%Y"),
+    ("%B %Y", "%B %Y"),
+    ("%d/%m/%Y", "%d/%m/%Y"),
+]
+
+
+class Errors:
+    def __init__(self):
+        self.errors = list()
+
+    def add(self, message):
+        self.errors.append(message)
+
+
+class Download:
+    """Serves synthesised catalog pages and metadata documents"""
+
+    def __init__(self, catalog, documents):
+        self.catalog = catalog
+        self.documents = documents
+
+    def download(self, url, **kwargs):
+        if "api/catalog/latest" in url:
+            query = dict(x.split("=") for x in url.split("?")[1].split("&"))
+            limit = int(query["limit"])
+            offset = int(query["offset"])
+            page = {
+                "found": len(self.catalog),
+                "result": self.catalog[offset : offset + limit],
+            }
+            return CachedResponse(json.dumps(page).encode("utf-8"), dict())
+        dataset_id = url.split("/")[-2]
+        return CachedResponse(self.documents[dataset_id], dict())
+
+
+def setup():
+    Configuration._create(
+        user_agent="benchmark",
+        hdx_key="12345",
+        hdx_read_only=True,
+        project_config_yaml=join("tests", "config", "project_configuration.yaml"),
+    )
+    Country.countriesdata(use_live=False)
+    iso3s = sorted(Country.countriesdata()["countries"])
+    Locations.set_validlocations(
+        [
+            {"name": x.lower(), "title": Country.get_country_name_from_iso3(x)}
+            for x in iso3s
+        ]
+    )
+    # HDX vocabularies are cached per process after their first download, so
+    # seed them to keep the network out of the timings
+    tags = set()
+    for text in TOPICS + KEYWORDS:
+        tags.update(tokenize_tags(text))
+    Vocabulary.set_tagsdict({x: {"Action to Take": "ok"} for x in tags})
+    Vocabulary._approved_vocabulary = Vocabulary(
+        {"name": "Topics", "id": "1234", "tags": [{"name": x} for x in tags]}
+    )
+    return Configuration.read(), iso3s
+
+
+def synthesise(studies, iso3s, seed=1):
+    rng = random.Random(seed)
+    fixtures = [
+        load_json(join("tests", "fixtures", f"metadata_{x}.json"))
+        for x in ("187", "272")
+    ]
+    nations = [(Country.get_country_name_from_iso3(x), x) for x in iso3s[:80]]
+    catalog = list()
+    documents = dict()
+    for i in range(studies):
+        dataset_id = str(1000 + i)
+        document = copy.deepcopy(fixtures[i % len(fixtures)])
+        study_desc = document["study_desc"]
+        idno = f"UNHCR-BENCH-{dataset_id}"
+        study_desc["title_statement"]["idno"] = idno
+        study_info = study_desc["study_info"]
+        study_nations = list()
+        for name, iso3 in rng.sample(nations, rng.choice((1, 1, 1, 2, 3))):
+            # a third of nations only have a name so need fuzzy matching
+            if rng.random() < 0.33:
+                iso3 = ""
+            study_nations.append({"name": name, "abbreviation": iso3})
+        study_info["nation"] = study_nations
+        study_info["topics"] = [
+            {"topic": x} for x in rng.sample(TOPICS, rng.randint(1, 5))
+        ]
+        study_info["keywords"] = [
+            {"keyword": x} for x in rng.sample(KEYWORDS, rng.randint(0, 4))
+        ]
+        start_format, end_format = rng.choice(DATE_FORMATS)
+        year = rng.randint(2010, 2024)
+        month = rng.randint(1, 11)
+        start = time.struct_time((year, month, 1, 0, 0, 0, 0, 1, -1))
+        end = time.struct_time((year, month + 1, 28, 0, 0, 0, 0, 1, -1))
+        study_info["coll_dates"] = [
+            {
+                "start": time.strftime(start_format, start),
+                "end": time.strftime(end_format, end),
+                "cycle": "",
+            }
+        ]
+        documents[dataset_id] = json.dumps(document).encode("utf-8")
+        catalog.append(
+            {
+                "id": dataset_id,
+                "idno": idno,
+                "changed": "Dec-05-2019",
+                "url": f"https://lala/index.php/catalog/{dataset_id}",
+            }
+        )
+    return catalog, documents
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run(studies, repeat):
+    """Run each measurement repeat times keeping the best to reduce noise"""
+    configuration, iso3s = setup()
+    catalog, documents = synthesise(studies, iso3s)
+    downloader = Download(catalog, documents)
+    results = dict()
+    for _ in range(repeat):
+        result, errors = measure(configuration, catalog, documents, downloader)
+        for stage, value in result.items():
+            results[stage] = min(value, results.get(stage, value))
+    return results, errors
+
+
+def measure(configuration, catalog, documents, downloader):
+    results = dict()
+
+    unhcr = Pipeline(configuration, downloader, CountryResolver())
+    results["get_dataset_info"], dataset_infos = timed(unhcr.get_dataset_info)
+
+    def parse():
+        return [decode_metadata(x) for x in documents.values()]
+
+    results["json_parsing"], metadatas = timed(parse)
+    study_infos = [x["study_desc"]["study_info"] for x in metadatas]
+
+    def lookup_countries():
+        countries = CountryResolver()
+        for study_info in study_infos:
+            for nation in study_info["nation"]:
+                countries.get_iso3(nation)
+
+    results["country_lookup"], _ = timed(lookup_countries)
+
+    def process_tags():
+        tokenize_tags.cache_clear()
+        for study_info in study_infos:
+            get_tags(study_info)
+
+    results["tag_processing"], _ = timed(process_tags)
+
+    def parse_dates():
+        parse_date.cache_clear()
+        for study_info in study_infos:
+            get_collection_period(study_info["coll_dates"])
+
+    results["date_parsing"], _ = timed(parse_dates)
+
+    def generate():
+        unhcr = Pipeline(configuration, downloader, CountryResolver())
+        errors = Errors()
+        for dataset_info in dataset_infos:
+            unhcr.generate_dataset(dataset_info, errors)
+        return errors
+
+    tokenize_tags.cache_clear()
+    parse_date.cache_clear()
+    results["generate_dataset"], errors = timed(generate)
+    # Dataset/Resource construction and validation is what is left once the
+    # separately timed stages are taken out of the end to end time
+    results["dataset_construction"] = max(
+        results["generate_dataset"]
+        - results["json_parsing"]
+        - results["country_lookup"]
+        - results["tag_processing"]
+        - results["date_parsing"],
+        0.0,
+    )
+    tokenize_tags.cache_clear()
+    parse_date.cache_clear()
+    tracemalloc.start()
+    generate()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results["peak_memory_mb"] = peak / 1024 / 1024
+    return results, len(errors.errors)
+
+
+def compare(results, baseline, threshold):
+    regressions = list()
+    for stage, value in results.items():
+        previous = baseline.get(stage)
+        if not previous:
+            continue
+        change = (value - previous) / previous
+        flag = ""
+        if change > threshold:
+            flag = " REGRESSION"
+            regressions.append(stage)
+        print(
+            f"{stage:>22}: {value:10.4f} (baseline {previous:10.4f}, {change:+.0%}){flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--studies", type=int, default=2000)
+    parser.add_argument(
+        "--baseline", default=join("benchmarks", "baseline_pipeline.json")
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results, errors = run(args.studies, args.repeat)
+    print(
+        f"{args.studies} studies, {errors} generation errors, {decode.backend} decoding"
+    )
+    if args.update_baseline or not exists(args.baseline):
+        for stage, value in results.items():
+            print(f"{stage:>22}: {value:10.4f}")
+        save_json(results, args.baseline, pretty=True)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    regressions = compare(results, load_json(args.baseline), args.threshold)
+    if regressions:
+        print(f"Regressions in: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
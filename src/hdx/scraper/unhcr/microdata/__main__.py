@@ -5,59 +5,534 @@ Top level script. Calls other functions that generate datasets that this script
 """
 
 import logging
-from os.path import expanduser, join
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import ExitStack
+from dataclasses import dataclass, replace
+from multiprocessing import get_context
+from os.path import expanduser, join, splitext
+from shutil import rmtree
 from traceback import format_exc
+from typing import Any, Optional, Tuple
 
-from hdx.api.configuration import Configuration
-from hdx.data.hdxobject import HDXError
-from hdx.data.user import User
-from hdx.facades.simple import facade
 from hdx.scraper.unhcr.microdata._version import __version__
-from hdx.scraper.unhcr.microdata.pipeline import Pipeline
-from hdx.utilities.downloader import Download
-from hdx.utilities.errors_onexit import ErrorsOnExit
-from hdx.utilities.path import progress_storing_tempdir, script_dir_plus_file
+from hdx.scraper.unhcr.microdata.changeset import Changeset
+from hdx.scraper.unhcr.microdata.countries import CountryResolver
+from hdx.scraper.unhcr.microdata.generationcache import get_generation_hash
+from hdx.scraper.unhcr.microdata.httpcache import CachingDownload
+from hdx.scraper.unhcr.microdata.metrics import Metrics
+from hdx.scraper.unhcr.microdata.prefetch import MetadataPrefetcher
+from hdx.scraper.unhcr.microdata.ratelimit import (
+    RateLimitedDownload,
+    leave_status_retries,
+)
+from hdx.scraper.unhcr.microdata.shard import in_shard, parse_shard
+from hdx.scraper.unhcr.microdata.snapshot import SnapshotRecorder, SnapshotReplay
+from hdx.scraper.unhcr.microdata.state import StudyState
+from hdx.scraper.unhcr.microdata.workqueue import (
+    FAILED,
+    FETCHED,
+    FINISHED,
+    GENERATED,
+    SKIPPED,
+    UPLOADED,
+    WorkQueue,
+)
+from hdx.utilities.base_downloader import DownloadError
+
+# Modules that import hdx.api, hdx.data, hdx.location and hdx.utilities modules
+# built on them (eg. loader, saver and path, which bring in frictionless) are
+# imported where they are used so that startup stays fast
 
 logger = logging.getLogger(__name__)
 
 lookup = "hdx-scraper-unhcr-microdata"
 
 
-def main():
+@dataclass
+class Run:
+    """What a run processes and what it records to. Worker processes copy the
+    run replacing the state, countries, metrics and errors with their own."""
+
+    configuration: Any
+    state: StudyState
+    countries: CountryResolver
+    metrics: Metrics
+    errors: Any
+    record: Optional[str] = None
+    replay: Optional[str] = None
+    retry_failed: bool = False
+    shard: Optional[Tuple[int, int]] = None
+    workers: int = 1
+    changeset: Optional[Changeset] = None
+    force: bool = False
+
+
+def get_downloader(configuration, stack, metrics, record, replay, shared=False):
+    if replay:
+        return stack.enter_context(SnapshotReplay(replay))
+    from hdx.utilities.downloader import Download
+    from hdx.utilities.path import get_temp_dir
+
+    http_downloader = stack.enter_context(Download())
+    # RateLimitedDownload retries throttling and server errors adapting its rate
+    leave_status_retries(http_downloader.session)
+    http_cache = configuration["http_cache"]
+    if shared:
+        # Shards on this machine take tokens from the same buckets
+        rate_limit_folder = get_temp_dir(configuration["rate_limit_folder"])
+    else:
+        rate_limit_folder = None
+    downloader = stack.enter_context(
+        CachingDownload(
+            stack.enter_context(
+                RateLimitedDownload(
+                    http_downloader,
+                    configuration["rate_limits"],
+                    metrics,
+                    rate_limit_folder,
+                    configuration["retry"],
+                )
+            ),
+            get_temp_dir(http_cache["folder"]),
+            http_cache["max_size"],
+            http_cache["ttls"],
+            metrics,
+        )
+    )
+    if record:
+        downloader = stack.enter_context(SnapshotRecorder(downloader, record))
+    return downloader
+
+
+def get_work_queue(configuration, replay, shard=None, resumable=True):
+    work_queue = configuration["work_queue"]
+    if replay:
+        # Nothing read from an archive changes on retrying
+        return WorkQueue(":memory:", max_attempts=1)
+    if not resumable:
+        path = ":memory:"
+    else:
+        from hdx.utilities.path import get_temp_dir
+
+        filename = work_queue["file"]
+        if shard:
+            stem, extension = splitext(filename)
+            filename = f"{stem}-{shard[0]}-of-{shard[1]}{extension}"
+        path = join(get_temp_dir("UNHCR-MICRODATA"), filename)
+    return WorkQueue(
+        path,
+        work_queue["max_attempts"],
+        work_queue["backoff"],
+        work_queue["claim_timeout"],
+    )
+
+
+def prepare_work_queue(queue, retry_failed):
+    # The run owns the queue so claims left are from a crashed run
+    queue.release_claims()
+    if retry_failed:
+        queue.reset_failed()
+    elif queue.has_work():
+        logger.info(f"Resuming run with batch {queue.batch}")
+    else:
+        queue.reset()
+
+
+def finish_work_queue(queue):
+    if queue.is_finished():
+        queue.delete()
+        return
+    failed = len(queue.get_failed())
+    unfinished = queue.count(exclude=FINISHED + (FAILED,))
+    if unfinished:
+        logger.warning(f"{unfinished} studies were not processed")
+        if queue.path != ":memory:":
+            logger.info("Run again to resume them")
+    if failed:
+        logger.warning(f"{failed} studies failed")
+        if queue.path != ":memory:":
+            logger.info("Run with --retry-failed to retry only them")
+
+
+def process(run, worker=None):
+    """Process the studies in the run's shard, an (i, N) pair, or all studies
+    if None. In a worker process, worker is the worker's (i, N) pair within the
+    shard and the work queue is prepared and finished by the parent process. If
+    the run has a changeset, it is written instead of HDX."""
+    from hdx.scraper.unhcr.microdata.generationcache import GenerationCache
+    from hdx.scraper.unhcr.microdata.pipeline import Pipeline
+    from hdx.scraper.unhcr.microdata.upload import Uploader
+    from hdx.scraper.unhcr.microdata.writer import UploadPool
+    from hdx.utilities.path import script_dir_plus_file
+
+    configuration = run.configuration
+    state = run.state
+    metrics = run.metrics
+    errors = run.errors
+    record = run.record
+    replay = run.replay
+    retry_failed = run.retry_failed
+    changeset = run.changeset
+    # Recording needs every study's metadata, replaying has no HDX to skip for
+    # and dry runs check every study against the changed configuration or code
+    skip_unchanged = not (record or replay or changeset or run.force)
+    shards = [x for x in (run.shard, worker) if x]
+    uploader = Uploader(state, errors, metrics, changeset)
+    seen = set()
+    with ExitStack() as stack:
+        downloader = get_downloader(
+            configuration, stack, metrics, record, replay, bool(shards)
+        )
+        if replay or changeset:
+            # Replays profile generation and dry runs check changes to it
+            cache = None
+        else:
+            cache = GenerationCache(
+                configuration["generation_cache_folder"], configuration
+            )
+        unhcr = Pipeline(configuration, downloader, run.countries, metrics, cache)
+        # Recordings and changesets must cover every study so are never resumed
+        queue = stack.enter_context(
+            get_work_queue(configuration, replay, run.shard, not (record or changeset))
+        )
+        if worker is None:
+            prepare_work_queue(queue, retry_failed)
+        if retry_failed:
+            dataset_infos = ()
+        else:
+            dataset_infos = unhcr.iter_dataset_info()
+            if shards:
+                dataset_infos = (x for x in dataset_infos if in_shard(x["id"], shards))
+        prefetcher = stack.enter_context(
+            MetadataPrefetcher(
+                unhcr.get_metadata,
+                queue.claim_each(dataset_infos),
+                should_fetch=lambda x: not skip_unchanged or not state.is_unchanged(x),
+                **configuration["prefetch"],
+            )
+        )
+        writer = stack.enter_context(
+            UploadPool(
+                uploader,
+                session=None if replay else configuration.get_session(),
+                **configuration["upload"],
+            )
+        )
+
+        def process_study(dataset_info, fetch):
+            dataset_id = dataset_info["id"]
+            url = dataset_info["url"]
+            seen.add(dataset_id)
+            if skip_unchanged and state.is_unchanged(dataset_info):
+                logger.info(f"Skipping unchanged dataset: {url}")
+                metrics.increment("unchanged_studies_skipped")
+                queue.finish(dataset_id, SKIPPED)
+                return
+            try:
+                metadata = fetch(dataset_info)
+            except DownloadError:
+                logger.exception(f"Error downloading metadata: {url}!")
+                errors.add(f"Dataset: {url}, error: {format_exc()}")
+                metrics.increment("download_failures")
+                queue.fail(dataset_id, format_exc())
+                return
+            queue.set_status(dataset_id, FETCHED)
+            dataset = unhcr.generate_dataset(dataset_info, errors, metadata)
+            if not dataset:
+                # Retrying cannot fix errors in the metadata
+                queue.fail(dataset_id, "Dataset could not be generated", retry=False)
+                return
+            dataset.update_from_yaml(
+                script_dir_plus_file(join("config", "hdx_dataset_static.yaml"), main)
+            )
+            metrics.increment("datasets_generated")
+            queue.set_status(dataset_id, GENERATED)
+            if replay:
+                queue.finish(dataset_id, SKIPPED)
+                return
+
+            def uploaded(success):
+                if success:
+                    queue.finish(dataset_id, UPLOADED)
+                else:
+                    queue.fail(dataset_id, "Dataset could not be created in HDX")
+
+            writer.submit(dataset_info, dataset, queue.batch, uploaded)
+
+        for dataset_info in prefetcher:
+            process_study(dataset_info, prefetcher.get)
+        # Retry failed studies as they become due along with any studies left
+        # from a previous run that are not in the catalog any more
+        while True:
+            # Failed uploads are only in the queue once reported
+            writer.join()
+            dataset_info = queue.claim()
+            if dataset_info is None:
+                wait = queue.next_retry()
+                if wait is None:
+                    break
+                logger.info(f"Waiting {wait:.0f}s to retry failed studies")
+                time.sleep(wait)
+                continue
+            logger.info(f"Retrying dataset: {dataset_info['url']}")
+            metrics.increment("study_retries")
+            process_study(dataset_info, unhcr.get_metadata)
+        if worker is None:
+            finish_work_queue(queue)
+    if changeset is not None and not shards and not retry_failed:
+        for dataset_id in sorted(set(state.studies) - seen):
+            changeset.add(dataset_id, "missing_from_catalog")
+    if worker is None:
+        run.countries.log_misses()
+        if not replay:
+            if changeset is None:
+                uploader.log_summary()
+            run.countries.save()
+
+
+def process_worker(run, worker, connection):
+    """Process the studies of worker in a worker process sending what the
+    parent process needs to merge down connection"""
+    from hdx.utilities.error_handler import ErrorHandler
+
+    configuration = run.configuration
+    # The connections of the session inherited from the parent cannot be shared
+    configuration.setup_session_remoteckan()
+    run = replace(
+        run,
+        state=StudyState(
+            configuration["state_file"], get_generation_hash(configuration)
+        ),
+        countries=CountryResolver(configuration["country_cache_file"]),
+        metrics=Metrics(),
+        errors=ErrorHandler(),
+    )
+    try:
+        process(run, worker)
+    except Exception:
+        logger.exception(f"Error in worker {worker[0]}!")
+        run.errors.add(f"Worker {worker[0]}, error: {format_exc()}")
+    finally:
+        if not run.replay:
+            run.countries.save()
+        if run.state.recorded:
+            run.state.save()
+        connection.send(
+            (
+                run.errors.shared_errors,
+                run.metrics.get_report(),
+                run.countries.iso3s,
+                run.countries.misses,
+            )
+        )
+        connection.close()
+
+
+def process_in_workers(run):
+    """Process the studies in the run's shard in worker processes that share
+    the work queue, merging their errors in worker order"""
+    from hdx.scraper.unhcr.microdata.upload import Uploader
+    from hdx.utilities.dictandlist import dict_of_sets_add
+
+    queue = get_work_queue(run.configuration, run.replay, run.shard)
+    prepare_work_queue(queue, run.retry_failed)
+    queue.close()
+    # Forked workers inherit the run including the HDX configuration
+    context = get_context("fork")
+    processes = list()
+    for i in range(run.workers):
+        receiver, sender = context.Pipe(duplex=False)
+        worker = context.Process(
+            target=process_worker,
+            args=(run, (i, run.workers), sender),
+            name=f"worker-{i}",
+        )
+        worker.start()
+        sender.close()
+        processes.append((worker, receiver))
+    for i, (worker, receiver) in enumerate(processes):
+        try:
+            shared_errors, report, iso3s, misses = receiver.recv()
+        except EOFError:
+            worker.join()
+            run.errors.add(f"Worker {i} exited with code {worker.exitcode}")
+            continue
+        worker.join()
+        for message_type, categories in shared_errors.items():
+            for category, messages in categories.items():
+                for message in messages:
+                    dict_of_sets_add(
+                        run.errors.shared_errors[message_type], category, message
+                    )
+        run.metrics.merge(report)
+        run.countries.merge(iso3s, misses)
+    with get_work_queue(run.configuration, run.replay, run.shard) as queue:
+        finish_work_queue(queue)
+    run.countries.log_misses()
+    if not run.replay:
+        Uploader(run.state, run.errors, run.metrics).log_summary()
+
+
+def main(
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    report: Optional[str] = None,
+    prometheus_textfile: Optional[str] = None,
+    retry_failed: bool = False,
+    shard: Optional[str] = None,
+    workers: int = 1,
+    dry_run: Optional[str] = None,
+    previous_changeset: Optional[str] = None,
+    refresh_generation_cache: bool = False,
+    force: bool = False,
+) -> None:
+    """Generate datasets and create them in HDX
+
+    Args:
+        record (Optional[str]): Record catalog and metadata to this archive. Defaults to None.
+        replay (Optional[str]): Generate datasets from this archive without touching HDX. Defaults to None.
+        report (Optional[str]): Write JSON run report with timings and counts to this file. Defaults to None.
+        prometheus_textfile (Optional[str]): Write run metrics in Prometheus textfile format to this file. Defaults to None.
+        retry_failed (bool): Only retry studies that failed in the last run. Defaults to False.
+        shard (Optional[str]): Only process shard i of N studies given as i/N eg. 0/4. Defaults to None.
+        workers (int): Number of processes generating datasets. Defaults to 1.
+        dry_run (Optional[str]): Write changes to this JSON lines changeset instead of HDX. Defaults to None.
+        previous_changeset (Optional[str]): Compare dry run changeset with this one. Defaults to None.
+        refresh_generation_cache (bool): Regenerate every dataset discarding cached ones. Defaults to False.
+        force (bool): Regenerate and check every study even if unchanged. Defaults to False.
+
+    Returns:
+        None
+    """
+    from hdx.api.configuration import Configuration
+    from hdx.data.user import User
+    from hdx.utilities.errors_onexit import ErrorsOnExit
+
     logger.info(f"##### {lookup} version {__version__} ####")
+    if shard:
+        shard = parse_shard(shard)
+    if workers > 1 and (record or dry_run):
+        # Archives and changesets have a single writer
+        raise ValueError("Cannot record or dry run with more than one worker!")
     configuration = Configuration.read()
-    User.check_current_user_write_access(
-        "abf4ca86-8e69-40b1-92f7-71509992be88", configuration=configuration
-    )
+    if not (replay or dry_run):
+        User.check_current_user_write_access(
+            "abf4ca86-8e69-40b1-92f7-71509992be88", configuration=configuration
+        )
+    if refresh_generation_cache or force:
+        rmtree(configuration["generation_cache_folder"], ignore_errors=True)
+    metrics = Metrics()
+    changeset = Changeset(dry_run) if dry_run else None
     with ErrorsOnExit() as errors:
-        with Download(rate_limit={"calls": 1, "period": 5}) as downloader:
-            unhcr = Pipeline(configuration, downloader)
-            dataset_ids = unhcr.get_dataset_info()
-            logger.info(f"Number of datasets to upload: {len(dataset_ids)}")
-            for info, dataset_info in progress_storing_tempdir(
-                "UNHCR-MICRODATA", dataset_ids, "id"
-            ):
-                dataset = unhcr.generate_dataset(dataset_info, errors)
-                if dataset:
-                    dataset.update_from_yaml(
-                        script_dir_plus_file(
-                            join("config", "hdx_dataset_static.yaml"), main
-                        )
-                    )
-                    try:
-                        dataset.create_in_hdx(
-                            remove_additional_resources=True,
-                            hxl_update=False,
-                            updated_by_script="HDX Scraper: UNHCR microdata",
-                            batch=info["batch"],
-                        )
-                    except HDXError:
-                        url = dataset_info["url"]
-                        logger.exception(f"Error with dataset: {url}!")
-                        errors.add(f"Dataset: {url}, error: {format_exc()}")
+        run = Run(
+            configuration,
+            StudyState(configuration["state_file"], get_generation_hash(configuration)),
+            CountryResolver(configuration["country_cache_file"]),
+            metrics,
+            errors,
+            record,
+            replay,
+            retry_failed,
+            shard,
+            workers,
+            changeset,
+            force,
+        )
+        try:
+            if workers > 1:
+                process_in_workers(run)
+            else:
+                process(run)
+        finally:
+            if run.state.recorded:
+                run.state.save()
+            if changeset is not None:
+                changeset.close()
+                if previous_changeset:
+                    changeset.compare(previous_changeset)
+            metrics.log_report()
+            if report:
+                metrics.save_json(report)
+            if prometheus_textfile:
+                metrics.save_prometheus(prometheus_textfile)
+
+
+def inspect(args=None):
+    """Build and query the local catalog index from cached metadata without
+    contacting UNHCR or HDX"""
+    from hdx.location.country import Country
+    from hdx.scraper.unhcr.microdata.catalog_index import (
+        CatalogIndex,
+        has_documents,
+        iter_documents,
+    )
+    from hdx.utilities.loader import load_yaml
+    from hdx.utilities.path import get_temp_dir, script_dir_plus_file
+
+    parser = ArgumentParser(
+        prog="python -m hdx.scraper.unhcr.microdata inspect",
+        description="Query an offline index of the studies in the catalog",
+    )
+    parser.add_argument(
+        "--source",
+        help="HTTP cache folder or snapshot archive to index. Defaults to the HTTP cache.",
+    )
+    parser.add_argument("--index", help="Index file. Defaults to one in temp folder.")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Rebuild the index from the source"
+    )
+    parser.add_argument("--search", help="Full text search eg. 'refugees AND food'")
+    parser.add_argument(
+        "--no-country",
+        action="store_true",
+        help="List studies none of whose nations map to a valid country",
+    )
+    parser.add_argument("--changed-since", help="List studies changed since date")
+    args = parser.parse_args(args)
+
+    configuration = load_yaml(
+        script_dir_plus_file(join("config", "project_configuration.yaml"), main)
+    )
+    index_path = args.index or join(
+        get_temp_dir("UNHCR-MICRODATA"), configuration["catalog_index_file"]
+    )
+    with CatalogIndex(index_path) as index:
+        if args.rebuild or args.source or not index.is_built():
+            source = args.source or get_temp_dir(configuration["http_cache"]["folder"])
+            if not has_documents(source):
+                logger.error(
+                    f"No downloaded documents to index in {source}! Run the scraper to fill the HTTP cache or pass a snapshot with --source."
+                )
+                sys.exit(1)
+            # Match country names offline
+            Country.countriesdata(use_live=False)
+            countries = CountryResolver(configuration["country_cache_file"])
+            index.build(iter_documents(source), configuration, countries)
+        studies = list()
+        if args.search:
+            studies.extend(index.search(args.search))
+        if args.no_country:
+            studies.extend(index.without_country())
+        if args.changed_since:
+            studies.extend(index.changed_since(args.changed_since))
+        for study in studies:
+            print(
+                "\t".join(
+                    study[x] or ""
+                    for x in ("id", "idno", "changed", "nations", "title")
+                )
+            )
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["inspect"]:
+        inspect(sys.argv[2:])
+        sys.exit()
+    from hdx.facades.infer_arguments import facade
+    from hdx.utilities.path import script_dir_plus_file
+
     facade(
         main,
         user_agent_config_yaml=join(expanduser("~"), ".useragents.yaml"),
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+"""
+Catalog index:
+-------------
+
+Local SQLite index of the studies in the catalog built from documents already
+downloaded, either in the HTTP cache folder or in a snapshot archive, so that
+the catalog can be searched and queried offline. Catalog pages give each
+study's idno and changed value and metadata exports give its nations, topics,
+keywords and collection dates. Text fields are indexed with FTS5 for full text
+search.
+
+"""
+
+import json
+import logging
+import re
+import sqlite3
+from os.path import exists, isdir, join
+from zipfile import ZipFile
+
+from hdx.scraper.unhcr.microdata.countries import CountryResolver
+from hdx.scraper.unhcr.microdata.dates import get_collection_period, parse_date
+from hdx.scraper.unhcr.microdata.decode import decode_metadata
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+DROP TABLE IF EXISTS studies;
+DROP TABLE IF EXISTS studies_fts;
+CREATE TABLE studies (
+    id TEXT PRIMARY KEY,
+    idno TEXT,
+    title TEXT,
+    url TEXT,
+    changed TEXT,
+    changed_date TEXT,
+    nations TEXT,
+    iso3s TEXT,
+    topics TEXT,
+    keywords TEXT,
+    start_date TEXT,
+    end_date TEXT
+);
+CREATE VIRTUAL TABLE studies_fts USING fts5(
+    id UNINDEXED, idno, title, nations, topics, keywords
+);
+"""
+
+COLUMNS = (
+    "id",
+    "idno",
+    "title",
+    "url",
+    "changed",
+    "changed_date",
+    "nations",
+    "iso3s",
+    "topics",
+    "keywords",
+    "start_date",
+    "end_date",
+)
+
+
+def has_documents(source):
+    """Whether source is an HTTP cache folder with an index or an archive"""
+    if isdir(source):
+        return exists(join(source, "index.json"))
+    return exists(source)
+
+
+def iter_documents(source):
+    """Yield the url and content of every document in source, an HTTP cache
+    folder or a snapshot archive. Cached documents are yielded oldest first so
+    that newer versions of a document override older ones."""
+    if isdir(source):
+        with open(join(source, "index.json")) as f:
+            index = json.load(f)
+        for url, entry in sorted(index.items(), key=lambda x: x[1]["stored"]):
+            try:
+                with open(join(source, entry["file"]), "rb") as f:
+                    yield url, f.read()
+            except FileNotFoundError:
+                continue
+        return
+    with ZipFile(source) as archive:
+        index = json.loads(archive.read("index.json"))
+        for url, member in index.items():
+            yield url, archive.read(member)
+
+
+def format_date(date):
+    if date is None:
+        return None
+    return date.date().isoformat()
+
+
+def is_valid_iso3(countryiso3):
+    from hdx.location.country import Country
+
+    return Country.get_country_name_from_iso3(countryiso3) is not None
+
+
+class CatalogIndex:
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def is_built(self):
+        """Whether the index has been built. Connecting creates an empty
+        database if there is none at path."""
+        cursor = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'studies'"
+        )
+        return cursor.fetchone() is not None
+
+    def build(self, documents, configuration, countries=None):
+        """Replace the index with the studies in documents, an iterable of url
+        and content pairs. Returns the number of studies indexed."""
+        if countries is None:
+            countries = CountryResolver()
+        catalog_url = configuration["catalog_url"]
+        metadata_url = re.compile(
+            re.escape(configuration["metadata_url"]).replace(r"\{\}", r"([^/]+)")
+        )
+        studies = dict()
+        for url, content in documents:
+            if catalog_url in url:
+                for result in json.loads(content).get("result", list()):
+                    study = studies.setdefault(result["id"], {"id": result["id"]})
+                    changed = result.get("changed")
+                    date = parse_date(changed) if changed else None
+                    fields = {
+                        "idno": result.get("idno"),
+                        "title": result.get("title"),
+                        "url": result.get("url"),
+                        "changed": changed,
+                        "changed_date": format_date(date[0]) if date else None,
+                    }
+                    study.update((k, v) for k, v in fields.items() if v is not None)
+                continue
+            match = metadata_url.search(url)
+            if match is None:
+                continue
+            dataset_id = match.group(1)
+            try:
+                metadata = decode_metadata(content)
+                study_desc = metadata["study_desc"]
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Could not decode metadata {url}")
+                continue
+            study = studies.setdefault(dataset_id, {"id": dataset_id})
+            study.update(self.get_metadata_fields(study_desc, countries, url))
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            for study in studies.values():
+                row = [study.get(x) for x in COLUMNS]
+                self.connection.execute(
+                    f"INSERT INTO studies VALUES ({','.join('?' * len(COLUMNS))})",
+                    row,
+                )
+                self.connection.execute(
+                    "INSERT INTO studies_fts VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        study.get(x)
+                        for x in (
+                            "id",
+                            "idno",
+                            "title",
+                            "nations",
+                            "topics",
+                            "keywords",
+                        )
+                    ],
+                )
+        logger.info(f"Indexed {len(studies)} studies in {self.path}")
+        return len(studies)
+
+    @staticmethod
+    def get_metadata_fields(study_desc, countries, url):
+        title_statement = study_desc.get("title_statement", dict())
+        study_info = study_desc.get("study_info", dict())
+        nations = study_info.get("nation", list())
+        countryiso3s = set()
+        for nation in nations:
+            countryiso3 = countries.get_iso3(nation, url)
+            if countryiso3 and is_valid_iso3(countryiso3):
+                countryiso3s.add(countryiso3)
+        fields = {
+            "nations": "; ".join(
+                x.get("name") or x.get("abbreviation") or "" for x in nations
+            ),
+            "iso3s": " ".join(sorted(countryiso3s)),
+            "topics": "; ".join(x["topic"] for x in study_info.get("topics", list())),
+            "keywords": "; ".join(
+                x["keyword"] for x in study_info.get("keywords", list())
+            ),
+        }
+        for key in ("idno", "title"):
+            if title_statement.get(key):
+                fields[key] = title_statement[key]
+        period = get_collection_period(study_info.get("coll_dates", list()))
+        if period is not None:
+            fields["start_date"] = format_date(period[0])
+            fields["end_date"] = format_date(period[1])
+        return fields
+
+    def query(self, query, params=()):
+        return [dict(x) for x in self.connection.execute(query, params)]
+
+    def search(self, text):
+        """Studies matching FTS5 query text, best matches first"""
+        return self.query(
+            "SELECT studies.* FROM studies_fts JOIN studies USING (id) "
+            "WHERE studies_fts MATCH ? ORDER BY rank",
+            (text,),
+        )
+
+    def without_country(self):
+        """Studies with metadata none of whose nations resolve to a valid
+        country"""
+        return self.query(
+            "SELECT * FROM studies WHERE nations IS NOT NULL AND iso3s = '' "
+            "ORDER BY CAST(id AS INTEGER)"
+        )
+
+    def changed_since(self, text):
+        """Studies changed on or after the date in text"""
+        date = parse_date(text)
+        if date is None:
+            raise ValueError(f"Invalid date {text}!")
+        return self.query(
+            "SELECT * FROM studies WHERE changed_date >= ? "
+            "ORDER BY changed_date, CAST(id AS INTEGER)",
+            (format_date(date[0]),),
+        )
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+"""
+Changeset:
+---------
+
+JSON lines record of what a dry run would do to each dataset in HDX (create,
+update or unchanged) that can be compared with the changeset of a previous dry
+run eg. before and after a configuration or logic change. Studies in state that
+are no longer in the catalog are recorded as missing_from_catalog: runs leave
+their datasets in HDX.
+
+"""
+
+import json
+import logging
+import threading
+from os.path import exists
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ("create", "update", "unchanged", "missing_from_catalog")
+
+
+class Changeset:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+        self.counts = dict.fromkeys(ACTIONS, 0)
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        counts = ", ".join(f"{v} {k}" for k, v in self.counts.items())
+        logger.info(f"Changeset written to {self.path}: {counts}")
+
+    def add(self, dataset_id, action, name=None, changes=None):
+        entry = {"id": dataset_id, "action": action}
+        if name:
+            entry["name"] = name
+        if changes:
+            entry["changes"] = changes
+        line = f"{json.dumps(entry, separators=(',', ':'))}\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.counts[action] += 1
+
+    @staticmethod
+    def load(path):
+        entries = dict()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["id"]] = entry
+        return entries
+
+    def compare(self, previous_path):
+        """Log and return the studies whose entry differs from the changeset at
+        previous_path as a list of (id, previous entry, entry)"""
+        if not exists(previous_path):
+            logger.warning(f"No previous changeset at {previous_path}")
+            return []
+        previous = self.load(previous_path)
+        current = self.load(self.path)
+        differences = list()
+        for dataset_id in sorted(set(previous) | set(current)):
+            previous_entry = previous.get(dataset_id)
+            entry = current.get(dataset_id)
+            if previous_entry == entry:
+                continue
+            differences.append((dataset_id, previous_entry, entry))
+            before = describe(previous_entry)
+            after = describe(entry)
+            logger.info(f"Changeset differs for {dataset_id}: {before} -> {after}")
+        logger.info(
+            f"{len(differences)} of {len(current)} studies differ from {previous_path}"
+        )
+        return differences
+
+
+def describe(entry):
+    if entry is None:
+        return "absent"
+    changes = entry.get("changes")
+    if changes:
+        return f"{entry['action']} ({', '.join(changes)})"
+    return entry["action"]
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+"""
+Countries:
+---------
+
+Resolves the nations listed in study metadata to ISO3 codes, memoising fuzzy
+matches of country names in a file that persists between runs. Saving merges
+with the file on disk so that shards of a run can share it.
+
+"""
+
+import logging
+from os.path import exists
+
+from hdx.scraper.unhcr.microdata.filelock import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class CountryResolver:
+    def __init__(self, path=None):
+        self.path = path
+        if path and exists(path):
+            from hdx.utilities.loader import load_json
+
+            self.iso3s = load_json(path)
+        else:
+            self.iso3s = dict()
+        self.misses = dict()
+        self.fuzzy_matches = 0
+
+    def get_iso3(self, nation, url=None):
+        countryiso3 = nation["abbreviation"]
+        if countryiso3:
+            return countryiso3
+        countryname = nation["name"]
+        if not countryname:
+            return None
+        countryiso3 = self.iso3s.get(countryname)
+        if countryiso3:
+            return countryiso3
+        if countryname in self.misses:
+            self.misses[countryname].add(url)
+            return None
+        self.fuzzy_matches += 1
+        # Country data is only loaded if a name needs matching
+        from hdx.location.country import Country
+
+        countryiso3, _ = Country.get_iso3_country_code_fuzzy(countryname)
+        if countryiso3:
+            self.iso3s[countryname] = countryiso3
+        else:
+            self.misses[countryname] = {url}
+        return countryiso3
+
+    def merge(self, iso3s, misses):
+        """Add matches and misses from another resolver eg. in a worker process"""
+        self.iso3s.update(iso3s)
+        for countryname, urls in misses.items():
+            self.misses.setdefault(countryname, set()).update(urls)
+
+    def log_misses(self):
+        for countryname, urls in sorted(self.misses.items()):
+            urls = ", ".join(sorted(x for x in urls if x))
+            logger.warning(f"Could not match country {countryname}: {urls}")
+
+    def save(self):
+        if not self.path:
+            return
+        from hdx.utilities.loader import load_json
+        from hdx.utilities.saver import save_json
+
+        with file_lock(self.path):
+            if exists(self.path):
+                iso3s = load_json(self.path)
+                iso3s.update(self.iso3s)
+                self.iso3s = iso3s
+            save_json(self.iso3s, self.path, pretty=True, sortkeys=True)
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+"""
+Dates:
+-----
+
+Parses the collection dates of studies. The YYYY, YYYY-MM and YYYY-MM-DD forms
+that nearly all studies use are parsed directly and anything else falls back
+on dateutil through parse_date_range. Parsed strings are memoised as the same
+dates recur across the catalog.
+
+"""
+
+import re
+from calendar import monthrange
+from datetime import datetime, timezone
+from functools import lru_cache
+
+ISO_DATE = re.compile(r"(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?")
+
+
+@lru_cache(maxsize=4096)
+def parse_date(text):
+    """Return the first and last day of the date or period in text as UTC
+    datetimes (the same range as parse_date_range) or None if it is invalid"""
+    text = text.strip()
+    if not text:
+        return None
+    match = ISO_DATE.fullmatch(text)
+    if match is None:
+        from dateutil.parser import ParserError
+
+        from hdx.utilities.dateparse import parse_date_range
+
+        try:
+            return parse_date_range(text)
+        except (ParserError, OverflowError, ValueError):
+            return None
+    year, month, day = (None if x is None else int(x) for x in match.groups())
+    try:
+        # A zero month or day is invalid rather than missing
+        if day is not None:
+            start = datetime(year, month, day, tzinfo=timezone.utc)
+            return start, start
+        if month is not None:
+            start = datetime(year, month, 1, tzinfo=timezone.utc)
+            end = start.replace(day=monthrange(year, month)[1])
+            return start, end
+        return (
+            datetime(year, 1, 1, tzinfo=timezone.utc),
+            datetime(year, 12, 31, tzinfo=timezone.utc),
+        )
+    except ValueError:
+        return None
+
+
+def get_collection_period(coll_dates):
+    """Return the earliest start and latest end over all coll_dates entries or
+    None if no entry has a valid date. An entry missing a valid start or end
+    uses the other for both."""
+    starts = list()
+    ends = list()
+    for coll_date in coll_dates:
+        start = parse_date(coll_date.get("start") or "")
+        end = parse_date(coll_date.get("end") or "")
+        if start is None and end is None:
+            continue
+        starts.append((start or end)[0])
+        ends.append((end or start)[1])
+    if not starts:
+        return None
+    return min(starts), max(ends)
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+"""
+Decode:
+------
+
+Decodes DDI metadata exports keeping only the parts of study_desc that are used
+to generate datasets. With msgspec installed, the rest of the document (doc_desc,
+data files, variables etc.) is skipped during decoding rather than parsed. With
+orjson installed, the whole document is parsed faster than by the standard
+library before being trimmed.
+
+"""
+
+import json
+from typing import Any, Dict, List, TypedDict
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class Method(TypedDict, total=False):
+    data_collection: Dict[str, Any]
+
+
+class StudyDesc(TypedDict, total=False):
+    title_statement: Dict[str, Any]
+    authoring_entity: List[Dict[str, Any]]
+    study_info: Dict[str, Any]
+    method: Method
+
+
+class Metadata(TypedDict, total=False):
+    study_desc: StudyDesc
+
+
+if msgspec is not None:
+    decoder = msgspec.json.Decoder(Metadata)
+    backend = "msgspec"
+elif orjson is not None:
+    backend = "orjson"
+else:
+    backend = "json"
+
+
+def trim_metadata(metadata):
+    """Keep only the parts of metadata described by Metadata"""
+    study_desc = metadata["study_desc"]
+    trimmed = {
+        key: study_desc[key]
+        for key in StudyDesc.__annotations__
+        if key in study_desc and key != "method"
+    }
+    method = study_desc.get("method")
+    if method is not None:
+        trimmed["method"] = {
+            key: method[key] for key in Method.__annotations__ if key in method
+        }
+    return {"study_desc": trimmed}
+
+
+def decode_metadata(content):
+    """Decode the bytes of a metadata export"""
+    if backend == "msgspec":
+        return decoder.decode(content)
+    if backend == "orjson":
+        return trim_metadata(orjson.loads(content))
+    return trim_metadata(json.loads(content))
@@ -0,0 +1,23 @@
+#!/usr/bin/python
+"""
+File lock:
+---------
+
+Advisory lock on a file so that processes sharing state on disk (eg. shards of
+a run on the same machine) take turns to read and write it.
+
+"""
+
+import fcntl
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path.lock while in the with block"""
+    with open(f"{path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+"""
+Generation cache:
+----------------
+
+Caches the dataset generated for each study under a hash of the inputs that
+generation consumes: the decoded parts of the metadata, the study's url and the
+release and configuration it is generated with. The study's changed value is
+not part of the key, so when it moves because of edits to parts of the
+metadata that are not used (eg. doc_desc), the cached dataset is reused with
+its resources dated by the new changed value rather than being generated again.
+The cache is kept in a folder that persists between runs.
+
+"""
+
+import hashlib
+import json
+import logging
+from os import makedirs, replace
+from os.path import dirname, exists, join
+
+from hdx.scraper.unhcr.microdata._version import __version_tuple__
+
+logger = logging.getLogger(__name__)
+
+CONFIGURATION_KEYS = ("base_url", "metadata_url", "documentation_url", "auth_url")
+
+
+def get_release():
+    """Release part of the package version, which unlike the dev and local
+    parts does not move with every commit eg. of the state file"""
+    return ".".join(str(x) for x in __version_tuple__ if isinstance(x, int))
+
+
+def get_generation_hash(configuration):
+    """Hash of the release and the configuration that datasets are generated
+    from including the static dataset metadata"""
+    with open(join(dirname(__file__), "config", "hdx_dataset_static.yaml")) as f:
+        static = f.read()
+    inputs = {
+        "release": get_release(),
+        "configuration": {x: configuration[x] for x in CONFIGURATION_KEYS},
+        "static": static,
+    }
+    inputs = json.dumps(inputs, sort_keys=True)
+    return hashlib.sha256(inputs.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    def __init__(self, folder, configuration):
+        self.folder = folder
+        makedirs(folder, exist_ok=True)
+        self.generation = get_generation_hash(configuration)
+
+    def get_key(self, dataset_info, metadata):
+        inputs = {
+            "generation": self.generation,
+            "url": dataset_info["url"],
+            "metadata": metadata,
+        }
+        inputs = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(inputs.encode("utf-8")).hexdigest()
+
+    def get_path(self, dataset_id):
+        return join(self.folder, f"{dataset_id}.json")
+
+    def get(self, dataset_id, key):
+        """Return the cached dataset if it was generated from inputs with this
+        key or None"""
+        path = self.get_path(dataset_id)
+        if not exists(path):
+            return None
+        from hdx.data.dataset import Dataset
+        from hdx.utilities.loader import load_json
+
+        entry = load_json(path)
+        if entry["key"] != key:
+            return None
+        return Dataset(entry["dataset"])
+
+    def set(self, dataset_id, key, dataset):
+        from hdx.utilities.saver import save_json
+
+        path = self.get_path(dataset_id)
+        temp_path = f"{path}.tmp"
+        save_json({"key": key, "dataset": dataset.get_dataset_dict()}, temp_path)
+        replace(temp_path, path)
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+"""
+HTTP cache:
+----------
+
+On disk cache of downloaded documents. Cached documents are served without a
+request while younger than the TTL of their endpoint and are otherwise
+revalidated with If-None-Match/If-Modified-Since so that unchanged documents
+come back as 304s. A document downloaded with a version (eg. a study's changed
+value in the catalog) is revalidated whatever its TTL when the version differs
+from the one it was cached with. The least recently used documents are evicted
+once the cache exceeds its maximum size. The index is saved every save_every
+documents stored and on closing, merged with the one on disk so that processes
+can share the cache.
+
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from os import makedirs, remove
+from os.path import exists, join
+
+from hdx.scraper.unhcr.microdata.filelock import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse:
+    status_code = 200
+
+    def __init__(self, content, headers):
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class CachingDownload:
+    """Wraps a downloader, caching responses to GET requests in folder. ttls maps
+    url fragments to the number of seconds a document is used without being
+    revalidated. The first fragment contained in the url is used."""
+
+    def __init__(
+        self, downloader, folder, max_size, ttls, metrics=None, save_every=100
+    ):
+        self.downloader = downloader
+        self.metrics = metrics
+        self.folder = folder
+        self.max_size = max_size
+        self.ttls = ttls
+        self.save_every = save_every
+        self.unsaved = 0
+        makedirs(folder, exist_ok=True)
+        self.index_path = join(folder, "index.json")
+        if exists(self.index_path):
+            from hdx.utilities.loader import load_json
+
+            self.index = load_json(self.index_path)
+        else:
+            self.index = dict()
+        self.evicted = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.save_index()
+        logger.info(
+            f"HTTP cache: {self.hits} hits, {self.revalidated} revalidated, {self.misses} misses"
+        )
+        if self.metrics:
+            self.metrics.increment("http_cache_hits", self.hits)
+            self.metrics.increment("http_cache_revalidated", self.revalidated)
+            self.metrics.increment("http_cache_misses", self.misses)
+
+    def save_index(self):
+        from hdx.utilities.loader import load_json
+        from hdx.utilities.saver import save_json
+
+        with file_lock(self.index_path):
+            if exists(self.index_path):
+                index = load_json(self.index_path)
+                for url in self.evicted:
+                    index.pop(url, None)
+                index.update(self.index)
+                self.index = index
+            save_json(self.index, self.index_path)
+        self.evicted = set()
+        self.unsaved = 0
+
+    def get_ttl(self, url):
+        for fragment, ttl in self.ttls.items():
+            if fragment in url:
+                return ttl
+        return 0
+
+    def get_path(self, entry):
+        return join(self.folder, entry["file"])
+
+    def read(self, entry):
+        entry["accessed"] = time.time()
+        with open(self.get_path(entry), "rb") as f:
+            content = f.read()
+        return CachedResponse(content, entry["headers"])
+
+    def store(self, url, response, version=None):
+        filename = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        content = response.content
+        with open(join(self.folder, filename), "wb") as f:
+            f.write(content)
+        now = time.time()
+        headers = dict()
+        for header in ("ETag", "Last-Modified", "Content-Type"):
+            value = response.headers.get(header)
+            if value:
+                headers[header] = value
+        self.index[url] = {
+            "file": filename,
+            "headers": headers,
+            "size": len(content),
+            "stored": now,
+            "accessed": now,
+        }
+        if version is not None:
+            self.index[url]["version"] = version
+        self.evict()
+        self.unsaved += 1
+        if self.unsaved >= self.save_every:
+            self.save_index()
+
+    def evict(self):
+        total = sum(x["size"] for x in self.index.values())
+        if total <= self.max_size:
+            return
+        for url, entry in sorted(self.index.items(), key=lambda x: x[1]["accessed"]):
+            if total <= self.max_size:
+                break
+            path = self.get_path(entry)
+            if exists(path):
+                remove(path)
+            del self.index[url]
+            self.evicted.add(url)
+            total -= entry["size"]
+            logger.info(f"Evicted {url} from HTTP cache")
+
+    def download(self, url, version=None, **kwargs):
+        """Download url using the cache. If version is given, a cached document
+        cached with a different version is revalidated."""
+        if kwargs.get("post"):
+            return self.downloader.download(url, **kwargs)
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is not None and not exists(self.get_path(entry)):
+                del self.index[url]
+                entry = None
+            if entry is not None:
+                fresh = time.time() - entry["stored"] < self.get_ttl(url)
+                if fresh and entry.get("version") == version:
+                    self.hits += 1
+                    return self.read(entry)
+                headers = dict(kwargs.get("headers") or {})
+                etag = entry["headers"].get("ETag")
+                if etag:
+                    headers["If-None-Match"] = etag
+                last_modified = entry["headers"].get("Last-Modified")
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+                kwargs["headers"] = headers
+        response = self.downloader.download(url, **kwargs)
+        with self.lock:
+            if response.status_code == 304 and entry is not None:
+                self.revalidated += 1
+                entry["stored"] = time.time()
+                if version is not None:
+                    entry["version"] = version
+                return self.read(entry)
+            self.misses += 1
+            self.store(url, response, version)
+        return response
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+"""
+Metrics:
+-------
+
+Timers and counters collected over a run and written out as a JSON run report
+and optionally in Prometheus textfile format.
+
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from os import replace
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = "unhcr_microdata"
+
+
+class Metrics:
+    def __init__(self):
+        self.started = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.timers = dict()
+        self.counters = dict()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = {"count": 0, "total": 0.0, "max": 0.0}
+                self.timers[name] = timer
+            timer["count"] += 1
+            timer["total"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, report):
+        """Add the timers and counters of a report eg. from a worker process"""
+        with self.lock:
+            for name, other in report["timers"].items():
+                timer = self.timers.get(name)
+                if timer is None:
+                    self.timers[name] = dict(other)
+                    continue
+                timer["count"] += other["count"]
+                timer["total"] += other["total"]
+                timer["max"] = max(timer["max"], other["max"])
+            for name, value in report["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def get_count(self, name):
+        return self.counters.get(name, 0)
+
+    def get_report(self):
+        with self.lock:
+            return {
+                "started": self.started.isoformat(),
+                "duration": time.perf_counter() - self.start,
+                "timers": {k: dict(v) for k, v in sorted(self.timers.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def log_report(self):
+        report = self.get_report()
+        logger.info(f"Run took {report['duration']:.1f}s")
+        for name, timer in report["timers"].items():
+            logger.info(
+                f"{name}: {timer['total']:.1f}s over {timer['count']} (max {timer['max']:.2f}s)"
+            )
+        for name, value in report["counters"].items():
+            logger.info(f"{name}: {value}")
+
+    def save_json(self, path):
+        from hdx.utilities.saver import save_json
+
+        save_json(self.get_report(), path, pretty=True)
+
+    def save_prometheus(self, path):
+        report = self.get_report()
+        lines = list()
+
+        def add(name, metric_type, value):
+            name = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+
+        add("run_duration_seconds", "gauge", report["duration"])
+        add("run_started_timestamp_seconds", "gauge", self.started.timestamp())
+        for name, timer in report["timers"].items():
+            add(f"{name}_seconds_total", "counter", timer["total"])
+            add(f"{name}_total", "counter", timer["count"])
+            add(f"{name}_max_seconds", "gauge", timer["max"])
+        for name, value in report["counters"].items():
+            add(f"{name}_total", "counter", value)
+        # Write then rename so the textfile collector never sees a partial file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines))
+            f.write("\n")
+        replace(temp_path, path)
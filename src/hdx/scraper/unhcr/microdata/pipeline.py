@@ -9,51 +9,118 @@ Generates urls from the UNHCR microdata website.
 
 import logging
 
-from dateutil.parser import ParserError
-from slugify import slugify
-
-from hdx.data.dataset import Dataset
-from hdx.data.hdxobject import HDXError
-from hdx.data.resource import Resource
-from hdx.location.country import Country
-from hdx.utilities.dateparse import parse_date_range
+from hdx.scraper.unhcr.microdata.countries import CountryResolver
+from hdx.scraper.unhcr.microdata.dates import get_collection_period
+from hdx.scraper.unhcr.microdata.decode import decode_metadata
+from hdx.scraper.unhcr.microdata.metrics import Metrics
+from hdx.scraper.unhcr.microdata.tags import get_tags
 
 logger = logging.getLogger(__name__)
 
 
 class Pipeline:
-    def __init__(self, configuration, downloader):
+    def __init__(
+        self, configuration, downloader, countries=None, metrics=None, cache=None
+    ):
         self.configuration = configuration
         self.downloader = downloader
+        if countries is None:
+            countries = CountryResolver()
+        self.countries = countries
+        if metrics is None:
+            metrics = Metrics()
+        self.metrics = metrics
+        self.cache = cache
 
-    def get_dataset_info(self):
+    def iter_dataset_info(self):
         url = f"{self.configuration['base_url']}{self.configuration['catalog_url']}"
-        response = self.downloader.download(f"{url}latest?limit=10000")
-        json = response.json()
-        if not json.get("found"):
-            raise ValueError("No datasets found!")
-        dataset_info = list()
-        for dataset in json["result"]:
-            idno = dataset["idno"]
-            if idno[:5] == "UNHCR":
-                dataset_info.append(
-                    {
-                        "id": dataset["id"],
+        page_size = self.configuration["catalog_page_size"]
+        offset = 0
+        seen = set()
+        while True:
+            with self.metrics.timer("catalog_download"):
+                response = self.downloader.download(
+                    f"{url}latest?limit={page_size}&offset={offset}"
+                )
+                json = response.json()
+            found = json.get("found")
+            if offset == 0:
+                if not found:
+                    raise ValueError("No datasets found!")
+                logger.info(f"Catalog contains {found} datasets")
+            results = json["result"]
+            new = 0
+            for dataset in results:
+                dataset_id = dataset["id"]
+                if dataset_id in seen:
+                    continue
+                seen.add(dataset_id)
+                new += 1
+                idno = dataset["idno"]
+                if idno[:5] == "UNHCR":
+                    yield {
+                        "id": dataset_id,
                         "changed": dataset["changed"],
                         "url": dataset["url"],
                     }
+                else:
+                    logger.info(f"Ignoring external dataset: {idno}")
+                    self.metrics.increment("external_datasets_skipped")
+            # A page with nothing new means offset is being ignored upstream
+            # and the rest of the catalog cannot be reached
+            if results and new == 0 and len(seen) < found:
+                raise ValueError(
+                    f"Catalog page at offset {offset} returned no new datasets with only {len(seen)} of {found} seen!"
                 )
-            else:
-                logger.info(f"Ignoring external dataset: {idno}")
-        return dataset_info
+            offset += len(results)
+            if len(results) < page_size or offset >= found:
+                break
 
-    def generate_dataset(self, dataset_info, errors):
-        dataset_id = dataset_info["id"]
+    def get_dataset_info(self):
+        return list(self.iter_dataset_info())
+
+    def get_metadata_url(self, dataset_id):
         metadata_url = self.configuration["metadata_url"].format(dataset_id)
-        json_url = f"{self.configuration['base_url']}{metadata_url}"
-        response = self.downloader.download(json_url)
-        json = response.json()
-        study_desc = json["study_desc"]
+        return f"{self.configuration['base_url']}{metadata_url}"
+
+    def get_metadata(self, dataset_info):
+        with self.metrics.timer("metadata_download"):
+            url = self.get_metadata_url(dataset_info["id"])
+            # A cached export is revalidated if the study changed since
+            response = self.downloader.download(url, version=dataset_info["changed"])
+            return decode_metadata(response.content)
+
+    def generate_dataset(self, dataset_info, errors, metadata=None):
+        if metadata is None:
+            metadata = self.get_metadata(dataset_info)
+        if self.cache is not None:
+            key = self.cache.get_key(dataset_info, metadata)
+            dataset = self.cache.get(dataset_info["id"], key)
+            if dataset is not None:
+                self.metrics.increment("generation_cache_hits")
+                # changed is not in the key but dates the resources
+                for resource in dataset.get_resources():
+                    resource.set_date_data_updated(dataset_info["changed"])
+                return dataset
+        with self.metrics.timer("dataset_generation"):
+            dataset = self.build_dataset(dataset_info, metadata, errors)
+        if dataset is None:
+            self.metrics.increment("generation_errors")
+        elif self.cache is not None:
+            self.cache.set(dataset_info["id"], key, dataset)
+        return dataset
+
+    def build_dataset(self, dataset_info, metadata, errors):
+        from slugify import slugify
+
+        from hdx.data.dataset import Dataset
+        from hdx.data.hdxobject import HDXError
+        from hdx.data.resource import Resource
+        from hdx.location.country import Country
+
+        dataset_id = dataset_info["id"]
+        json_url = self.get_metadata_url(dataset_id)
+        study_desc = metadata["study_desc"]
         title_statement = study_desc["title_statement"]
         title = title_statement["title"]
         logger.info(f"Creating dataset: {title}")
@@ -77,12 +144,9 @@ class Pipeline:
             methodology.append(f"Data Collection Mode: {collection}  \n")
         dataset_name = slugify(title_statement["idno"])
         countryiso3s = set()
+        ui_url = dataset_info["url"]
         for nation in study_info["nation"]:
-            countryiso3 = nation["abbreviation"]
-            if not countryiso3:
-                countryname = nation["name"]
-                if countryname:
-                    countryiso3, _ = Country.get_iso3_country_code_fuzzy(countryname)
+            countryiso3 = self.countries.get_iso3(nation, ui_url)
             if countryiso3:
                 countryiso3s.add(countryiso3)
         if len(countryiso3s) == 1:
@@ -102,7 +166,6 @@ class Pipeline:
         dataset.set_organization("abf4ca86-8e69-40b1-92f7-71509992be88")
         dataset.set_expected_update_frequency("Never")
         dataset.set_subnational(True)
-        ui_url = dataset_info["url"]
         try:
             dataset.add_country_locations(countryiso3s)
         except HDXError:
@@ -110,46 +173,16 @@ class Pipeline:
                 f"Invalid country id {countryiso3s} in {ui_url}: {title}. ( JSON url {json_url} )!"
             )
             return None
-        tags = list()
-
-        def add_tags(inwords, key):
-            for inword in inwords:
-                inword = inword[key].strip().lower()
-                if "," in inword:
-                    words = inword.split(",")
-                elif "/" in inword:
-                    words = inword.split("/")
-                else:
-                    words = [inword]
-                newwords = list()
-                for innerword in words:
-                    if "and" in innerword:
-                        newwords.extend(innerword.split(" and "))
-                    elif "&" in innerword:
-                        newwords.extend(innerword.split(" & "))
-                    elif "other" in innerword:
-                        newwords.extend(innerword.split("other"))
-                    else:
-                        newwords.append(innerword)
-                for word in newwords:
-                    word = word.strip()
-                    if word:
-                        tags.append(word.strip())
-
-        add_tags(study_info["topics"], "topic")
-        add_tags(study_info.get("keywords", list()), "keyword")
+        tags = get_tags(study_info)
         dataset.add_tags(tags)
         dataset.clean_tags()
-        coll_dates = study_info["coll_dates"][0]
-        try:
-            startdate, _ = parse_date_range(coll_dates["start"])
-            _, enddate = parse_date_range(coll_dates["end"])
-        except ParserError:
+        period = get_collection_period(study_info.get("coll_dates", list()))
+        if period is None:
             errors.add(
                 f"Invalid date(s) in {ui_url}: {title}. ( JSON url {json_url} )!"
             )
             return None
-        dataset.set_time_period(startdate, enddate)
+        dataset.set_time_period(*period)
 
         auth_url = self.configuration["auth_url"].format(dataset_id)
         resource = Resource(
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+"""
+Prefetch:
+--------
+
+Downloads study metadata ahead of the upload loop in a pool of threads so that
+the upstream rate limit keeps being used while datasets are written to HDX.
+
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataPrefetcher:
+    """Passes through the studies in dataset_infos, which can be a lazy iterable,
+    while fetching metadata using fetch for up to lookahead studies beyond the
+    one currently requested. Studies for which should_fetch returns False are
+    not prefetched."""
+
+    def __init__(
+        self, fetch, dataset_infos, workers=2, lookahead=10, should_fetch=None
+    ):
+        self.fetch = fetch
+        self.source = iter(dataset_infos)
+        self.exhausted = False
+        self.dataset_infos = list()
+        self.positions = dict()
+        self.lookahead = lookahead
+        self.should_fetch = should_fetch
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="prefetch"
+        )
+        self.futures = dict()
+        self.next_position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            if position == len(self.dataset_infos) and not self.pull():
+                return
+            yield self.dataset_infos[position]
+            position += 1
+
+    def close(self):
+        for future, _ in self.futures.values():
+            future.cancel()
+        self.futures = dict()
+        self.executor.shutdown(wait=True)
+
+    def pull(self):
+        if self.exhausted:
+            return False
+        try:
+            dataset_info = next(self.source)
+        except StopIteration:
+            self.exhausted = True
+            return False
+        self.positions[dataset_info["id"]] = len(self.dataset_infos)
+        self.dataset_infos.append(dataset_info)
+        return True
+
+    def schedule(self, position):
+        for dataset_id, (future, future_position) in list(self.futures.items()):
+            if future_position < position:
+                future.cancel()
+                del self.futures[dataset_id]
+        i = max(self.next_position, position)
+        while len(self.futures) <= self.lookahead:
+            if i == len(self.dataset_infos) and not self.pull():
+                break
+            dataset_info = self.dataset_infos[i]
+            if self.should_fetch is None or self.should_fetch(dataset_info):
+                future = self.executor.submit(self.fetch, dataset_info)
+                self.futures[dataset_info["id"]] = (future, i)
+            i += 1
+        self.next_position = max(self.next_position, i)
+
+    def get(self, dataset_info):
+        """Return the metadata for dataset_info, waiting for its download if
+        needed. Studies not yet prefetched are fetched directly."""
+        dataset_id = dataset_info["id"]
+        position = self.positions.get(dataset_id)
+        if position is None:
+            return self.fetch(dataset_info)
+        self.schedule(position)
+        future, _ = self.futures.pop(dataset_id, (None, None))
+        if future is None:
+            return self.fetch(dataset_info)
+        return future.result()
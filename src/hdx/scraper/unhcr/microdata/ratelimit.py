@@ -0,0 +1,299 @@
+#!/usr/bin/python
+"""
+Rate limiting:
+-------------
+
+Token buckets shared by every thread that downloads through the same
+RateLimitedDownload so that the upstream limit is respected globally rather
+than per request loop. Buckets can be kept in files so that they are also
+shared by processes on the same machine.
+
+Given min_calls and max_calls, a bucket adapts its rate by AIMD: the rate
+rises additively with each successful request and is cut multiplicatively
+whenever the server throttles (429) or fails (5xx), when requests are also
+paused for any Retry-After the server asks for. Throttled and failed requests
+are retried with jittered exponential backoff.
+
+"""
+
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from os.path import exists, getsize, join
+from urllib.parse import urlsplit
+
+from hdx.scraper.unhcr.microdata.filelock import file_lock
+from hdx.utilities.base_downloader import DownloadError
+
+logger = logging.getLogger(__name__)
+
+
+class AIMD:
+    """Rate bounds and adjustments in calls per second. Without min_calls and
+    max_calls, the rate stays at calls per period."""
+
+    def __init__(
+        self, calls, period, min_calls=None, max_calls=None, increase=0, decrease=1
+    ):
+        self.min_rate = (min_calls or calls) / period
+        self.max_rate = (max_calls or calls) / period
+        self.increase = increase / period
+        self.decrease = decrease
+
+    def increased(self, rate):
+        return min(rate + self.increase, self.max_rate)
+
+    def decreased(self, rate):
+        return max(rate * self.decrease, self.min_rate)
+
+
+class TokenBucket:
+    def __init__(self, calls, period, **kwargs):
+        self.capacity = calls
+        self.rate = calls / period
+        self.aimd = AIMD(calls, period, **kwargs)
+        self.tokens = calls
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = self.aimd.increased(self.rate)
+
+    def throttled(self, retry_after=None):
+        """Cut the rate, dropping any burst, and pause for retry_after seconds"""
+        with self.lock:
+            self.rate = self.aimd.decreased(self.rate)
+            self.tokens = min(self.tokens, 0)
+            if retry_after:
+                self.paused_until = max(
+                    self.paused_until, time.monotonic() + retry_after
+                )
+
+
+class FileTokenBucket:
+    """Token bucket whose state is kept in the file at path"""
+
+    def __init__(self, path, calls, period, **kwargs):
+        self.path = path
+        self.capacity = calls
+        self.initial_rate = calls / period
+        self.aimd = AIMD(calls, period, **kwargs)
+
+    @property
+    def rate(self):
+        from hdx.utilities.loader import load_json
+
+        with file_lock(self.path):
+            return self.load_state(load_json, time.time())["rate"]
+
+    def load_state(self, load_json, now):
+        if exists(self.path) and getsize(self.path):
+            state = load_json(self.path)
+        else:
+            state = {"tokens": self.capacity, "updated": now}
+        # Keep the shared rate within this bucket's bounds eg. if they changed
+        rate = state.get("rate", self.initial_rate)
+        state["rate"] = min(max(rate, self.aimd.min_rate), self.aimd.max_rate)
+        state.setdefault("paused_until", 0)
+        return state
+
+    def update(self, update):
+        """Call update with the state and current time under the file lock,
+        saving the state afterwards"""
+        from hdx.utilities.loader import load_json
+        from hdx.utilities.saver import save_json
+
+        with file_lock(self.path):
+            now = time.time()
+            state = self.load_state(load_json, now)
+            state["tokens"] = min(
+                self.capacity,
+                state["tokens"] + max(now - state["updated"], 0) * state["rate"],
+            )
+            state["updated"] = now
+            result = update(state, now)
+            save_json(state, self.path)
+        return result
+
+    def acquire(self):
+        """Block until a token is available. Returns the time spent waiting."""
+
+        def take(state, now):
+            if now < state["paused_until"]:
+                return state["paused_until"] - now
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0
+            return (1 - state["tokens"]) / state["rate"]
+
+        waited = 0.0
+        while True:
+            wait = self.update(take)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def succeeded(self):
+        def increase(state, now):
+            state["rate"] = self.aimd.increased(state["rate"])
+
+        self.update(increase)
+
+    def throttled(self, retry_after=None):
+        """Cut the rate, dropping any burst, and pause for retry_after seconds"""
+
+        def decrease(state, now):
+            state["rate"] = self.aimd.decreased(state["rate"])
+            state["tokens"] = min(state["tokens"], 0)
+            if retry_after:
+                state["paused_until"] = max(state["paused_until"], now + retry_after)
+
+        self.update(decrease)
+
+
+def get_retry_after(response):
+    """Seconds to wait given by the response's Retry-After header, which can be
+    a number of seconds or an HTTP date, or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+def leave_status_retries(session):
+    """Stop the retry configuration of session's adapters retrying on statuses
+    or Retry-After so that RateLimitedDownload sees throttling and server
+    errors. Connection errors are still retried by the adapters."""
+    for adapter in session.adapters.values():
+        max_retries = getattr(adapter, "max_retries", None)
+        if max_retries is not None:
+            adapter.max_retries = max_retries.new(
+                status_forcelist=None, respect_retry_after_header=False
+            )
+
+
+class RateLimitedDownload:
+    """Wraps a Download so that each request first takes a token from the bucket
+    of the url's host (or the default bucket). Requests on the underlying
+    session are serialised as Download keeps the last response on itself. If
+    folder is given, buckets are kept in files there. If retry is given,
+    requests failing with one of its statuses are retried up to its attempts
+    with backoff doubling from its backoff up to its max_backoff seconds."""
+
+    def __init__(self, downloader, rate_limits, metrics=None, folder=None, retry=None):
+        self.downloader = downloader
+        self.rate_limits = rate_limits
+        self.metrics = metrics
+        self.folder = folder
+        self.retry = retry
+        self.buckets = dict()
+        self.counts = dict()
+        self.buckets_lock = threading.Lock()
+        self.download_lock = threading.Lock()
+        self.start = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        for host, count in sorted(self.counts.items()):
+            rate = self.buckets[host].rate
+            logger.info(
+                f"{host}: {count} requests at {count / elapsed * 60:.1f}/min, rate limit ended at {rate * 60:.1f}/min"
+            )
+
+    def get_bucket(self, url):
+        host = urlsplit(url).hostname
+        with self.buckets_lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                rate_limit = self.rate_limits.get(host, self.rate_limits["default"])
+                if self.folder:
+                    bucket = FileTokenBucket(
+                        join(self.folder, f"{host}.json"), **rate_limit
+                    )
+                else:
+                    bucket = TokenBucket(**rate_limit)
+                self.buckets[host] = bucket
+                self.counts[host] = 0
+            self.counts[host] += 1
+            return host, bucket
+
+    def get_backoff(self, attempt, retry_after):
+        """Full jitter backoff for attempt, at least retry_after"""
+        backoff = min(self.retry["backoff"] * 2**attempt, self.retry["max_backoff"])
+        backoff = random.uniform(0, backoff)
+        if retry_after:
+            backoff = max(backoff, min(retry_after, self.retry["max_backoff"]))
+        return backoff
+
+    def download(self, url, **kwargs):
+        host, bucket = self.get_bucket(url)
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            if self.metrics:
+                self.metrics.add_time("rate_limit_wait", waited)
+            try:
+                with self.download_lock:
+                    response = self.downloader.download(url, **kwargs)
+            except DownloadError as ex:
+                # The requests exception is the cause and holds any response
+                error_response = getattr(ex.__cause__, "response", None)
+                if error_response is None or self.retry is None:
+                    raise
+                status = error_response.status_code
+                if status not in self.retry["statuses"]:
+                    raise
+                retry_after = get_retry_after(error_response)
+                bucket.throttled(retry_after)
+                if attempt >= self.retry["attempts"]:
+                    raise
+                backoff = self.get_backoff(attempt, retry_after)
+                attempt += 1
+                logger.warning(
+                    f"{url} returned {status}, retrying in {backoff:.1f}s (rate limit now {bucket.rate * 60:.1f}/min)"
+                )
+                if self.metrics:
+                    self.metrics.increment("download_retries")
+                time.sleep(backoff)
+                continue
+            bucket.succeeded()
+            return response
@@ -0,0 +1,35 @@
+#!/usr/bin/python
+"""
+Shards:
+------
+
+Splits the catalog between shards by a hash of each study's id that is stable
+across runs and machines, so that separate jobs or worker processes each
+process their own part of the catalog.
+
+"""
+
+import hashlib
+
+
+def parse_shard(text):
+    """Parse i/N into (i, N)"""
+    try:
+        index, count = (int(x) for x in text.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard {text} is not of the form i/N!")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard {text} must have 0 <= i < N!")
+    return index, count
+
+
+def in_shard(dataset_id, shards):
+    """Whether the study is in all of shards, a list of (i, N) pairs where each
+    pair splits the studies of the shard before it"""
+    digest = hashlib.sha1(dataset_id.encode("utf-8")).digest()
+    value = int.from_bytes(digest[:8], "big")
+    for index, count in shards:
+        if value % count != index:
+            return False
+        value //= count
+    return True
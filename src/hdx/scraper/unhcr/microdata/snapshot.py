@@ -0,0 +1,83 @@
+#!/usr/bin/python
+"""
+Snapshot:
+--------
+
+Records downloaded documents into a single compressed archive and replays them
+in place of a downloader so that the whole generation path can be run without
+network access. The archive is a zip file with one deflated member per url and
+an index.json member mapping urls to members.
+
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from hdx.scraper.unhcr.microdata.httpcache import CachedResponse
+from hdx.utilities.base_downloader import DownloadError
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotRecorder:
+    """Wraps a downloader, writing the content of every response to the archive
+    at path"""
+
+    def __init__(self, downloader, path):
+        self.downloader = downloader
+        self.path = path
+        self.archive = ZipFile(path, "w", compression=ZIP_DEFLATED)
+        self.index = dict()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.archive.writestr("index.json", json.dumps(self.index))
+            self.archive.close()
+        logger.info(f"Recorded {len(self.index)} documents to {self.path}")
+
+    def download(self, url, **kwargs):
+        response = self.downloader.download(url, **kwargs)
+        member = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        with self.lock:
+            if url not in self.index:
+                self.archive.writestr(member, response.content)
+                self.index[url] = member
+        return response
+
+
+class SnapshotReplay:
+    """Serves downloads from the archive at path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = ZipFile(path)
+        self.index = json.loads(self.archive.read("index.json"))
+        self.lock = threading.Lock()
+        logger.info(f"Replaying {len(self.index)} documents from {path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.archive.close()
+
+    def download(self, url, **kwargs):
+        member = self.index.get(url)
+        if member is None:
+            raise DownloadError(f"{url} is not in snapshot {self.path}!")
+        with self.lock:
+            content = self.archive.read(member)
+        return CachedResponse(content, dict())
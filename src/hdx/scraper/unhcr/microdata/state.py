@@ -0,0 +1,90 @@
+#!/usr/bin/python
+"""
+State:
+-----
+
+Remembers, per UNHCR catalog id, the last seen "changed" value and a hash of the
+dataset that was created in HDX so that unchanged studies can be skipped. A
+hash of the release and configuration that the dataset was generated with is
+also kept so that studies are regenerated when either changes. Saving merges
+with the file on disk so that shards of a run can share it. Recorded studies
+are saved at most every save_interval seconds and the state must be saved at
+the end of a run.
+
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from os.path import exists
+
+from hdx.scraper.unhcr.microdata.filelock import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class StudyState:
+    def __init__(self, path, generation=None, save_interval=60):
+        self.path = path
+        self.generation = generation
+        self.save_interval = save_interval
+        self.saved = time.monotonic()
+        if exists(path):
+            from hdx.utilities.loader import load_json
+
+            self.studies = load_json(path)
+            logger.info(f"Loaded state for {len(self.studies)} studies from {path}")
+        else:
+            self.studies = dict()
+        self.recorded = dict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def hash_dataset(dataset):
+        contents = {
+            "dataset": dataset.data,
+            "resources": [resource.data for resource in dataset.get_resources()],
+        }
+        contents = json.dumps(contents, sort_keys=True, default=str)
+        return hashlib.sha256(contents.encode("utf-8")).hexdigest()
+
+    def has_study(self, dataset_info):
+        return dataset_info["id"] in self.studies
+
+    def is_unchanged(self, dataset_info):
+        study = self.studies.get(dataset_info["id"])
+        if study is None:
+            return False
+        if study.get("generation") != self.generation:
+            return False
+        return study["changed"] == dataset_info["changed"]
+
+    def has_hash(self, dataset_info, dataset_hash):
+        study = self.studies.get(dataset_info["id"])
+        if study is None:
+            return False
+        return study["hash"] == dataset_hash
+
+    def record(self, dataset_info, dataset_hash):
+        study = {"changed": dataset_info["changed"], "hash": dataset_hash}
+        if self.generation:
+            study["generation"] = self.generation
+        with self.lock:
+            self.studies[dataset_info["id"]] = study
+            self.recorded[dataset_info["id"]] = study
+            due = time.monotonic() - self.saved >= self.save_interval
+        if due:
+            self.save()
+
+    def save(self):
+        from hdx.utilities.loader import load_json
+        from hdx.utilities.saver import save_json
+
+        with self.lock, file_lock(self.path):
+            if exists(self.path):
+                self.studies = load_json(self.path)
+                self.studies.update(self.recorded)
+            save_json(self.studies, self.path)
+            self.saved = time.monotonic()
@@ -0,0 +1,36 @@
+#!/usr/bin/python
+"""
+Tags:
+----
+
+Splits UNHCR topics and keywords into candidate HDX tags.
+
+"""
+
+import re
+from functools import lru_cache
+
+# Separators are commas, slashes, ampersands between words and the words "and"
+# and "other" delimited by whitespace or another separator (so that eg.
+# "standards", "mothers" and "cash-and-voucher" are left intact)
+TAG_SEPARATORS = re.compile(r",|/|\s&\s|(?<![^\s,/])(?:and|other)(?![^\s,/])")
+
+
+@lru_cache(maxsize=4096)
+def tokenize_tags(text):
+    """Return a tuple of the lower case tags in a topic or keyword"""
+    tags = list()
+    for tag in TAG_SEPARATORS.split(text.lower()):
+        tag = tag.strip()
+        if tag:
+            tags.append(tag)
+    return tuple(tags)
+
+
+def get_tags(study_info):
+    tags = list()
+    for topic in study_info["topics"]:
+        tags.extend(tokenize_tags(topic["topic"]))
+    for keyword in study_info.get("keywords", list()):
+        tags.extend(tokenize_tags(keyword["keyword"]))
+    return tags
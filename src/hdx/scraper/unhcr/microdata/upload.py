@@ -0,0 +1,137 @@
+#!/usr/bin/python
+"""
+Upload:
+------
+
+Creates generated datasets in HDX, skipping those that are unchanged from what
+was last written. A dataset is unchanged if it hashes the same as the last one
+recorded in the state file or, when the state file has no record of the study,
+if it matches the copy of the dataset already in HDX. In a dry run, what would
+be done to each dataset is written to a changeset instead.
+
+"""
+
+import logging
+from traceback import format_exc
+
+from hdx.scraper.unhcr.microdata.metrics import Metrics
+from hdx.scraper.unhcr.microdata.state import StudyState
+
+logger = logging.getLogger(__name__)
+
+
+def normalise(key, value):
+    if value is None:
+        return None
+    if key in ("tags", "groups"):
+        return sorted(x["name"] for x in value)
+    if key == "last_modified":
+        # HDX drops the microseconds that set_date_data_updated adds
+        return value[:19]
+    return value
+
+
+def diff_dataset(dataset, existing):
+    """Return the generated fields of dataset that differ from existing"""
+    changes = list()
+    for key, value in dataset.data.items():
+        if normalise(key, value) != normalise(key, existing.data.get(key)):
+            changes.append(key)
+    resources = dataset.get_resources()
+    existing_resources = existing.get_resources()
+    if len(resources) != len(existing_resources):
+        changes.append("resources")
+        return changes
+    for i, resource in enumerate(resources):
+        existing_resource = existing_resources[i]
+        for key, value in resource.data.items():
+            existing_value = existing_resource.data.get(key)
+            if normalise(key, value) != normalise(key, existing_value):
+                changes.append(f"resources[{i}].{key}")
+    return changes
+
+
+class Uploader:
+    def __init__(self, state, errors, metrics=None, changeset=None):
+        self.state = state
+        self.errors = errors
+        if metrics is None:
+            metrics = Metrics()
+        self.metrics = metrics
+        self.changeset = changeset
+
+    def is_unchanged(self, dataset_info, dataset, dataset_hash):
+        if self.state.has_hash(dataset_info, dataset_hash):
+            return True
+        if self.state.has_study(dataset_info):
+            return False
+        from hdx.data.dataset import Dataset
+
+        existing = Dataset.read_from_hdx(dataset["name"])
+        if existing is None:
+            return False
+        changes = diff_dataset(dataset, existing)
+        if changes:
+            logger.info(f"Changed in {dataset['name']}: {', '.join(changes)}")
+            return False
+        return True
+
+    def preview(self, dataset_info, dataset, dataset_hash):
+        """Add what upload would do to the changeset without writing to HDX or
+        recording state"""
+        from hdx.data.dataset import Dataset
+
+        name = dataset["name"]
+        if self.state.has_hash(dataset_info, dataset_hash):
+            self.changeset.add(dataset_info["id"], "unchanged", name)
+            return
+        existing = Dataset.read_from_hdx(name)
+        if existing is None:
+            self.changeset.add(dataset_info["id"], "create", name)
+            return
+        changes = diff_dataset(dataset, existing)
+        if changes:
+            self.changeset.add(dataset_info["id"], "update", name, changes)
+        else:
+            self.changeset.add(dataset_info["id"], "unchanged", name)
+
+    def upload(self, dataset_info, dataset, batch, errors=None):
+        """Create dataset in HDX unless unchanged returning whether it succeeded.
+        Errors are added to errors if given or otherwise those of the uploader."""
+        from hdx.data.hdxobject import HDXError
+
+        if errors is None:
+            errors = self.errors
+        url = dataset_info["url"]
+        dataset_hash = StudyState.hash_dataset(dataset)
+        try:
+            if self.changeset is not None:
+                self.preview(dataset_info, dataset, dataset_hash)
+                return True
+            if self.is_unchanged(dataset_info, dataset, dataset_hash):
+                logger.info(f"Dataset unaltered: {url}")
+                self.metrics.increment("datasets_unaltered")
+            else:
+                with self.metrics.timer("create_in_hdx"):
+                    dataset.create_in_hdx(
+                        remove_additional_resources=True,
+                        hxl_update=False,
+                        updated_by_script="HDX Scraper: UNHCR microdata",
+                        batch=batch,
+                    )
+                self.metrics.increment("datasets_created")
+        except HDXError:
+            logger.exception(f"Error with dataset: {url}!")
+            errors.add(f"Dataset: {url}, error: {format_exc()}")
+            self.metrics.increment("upload_failures")
+            return False
+        self.state.record(dataset_info, dataset_hash)
+        return True
+
+    def log_summary(self):
+        created = self.metrics.get_count("datasets_created")
+        unaltered = self.metrics.get_count("datasets_unaltered")
+        failed = self.metrics.get_count("upload_failures")
+        logger.info(
+            f"Datasets created or updated: {created}, unaltered: {unaltered}, failed: {failed}"
+        )
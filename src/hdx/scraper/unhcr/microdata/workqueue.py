@@ -0,0 +1,282 @@
+#!/usr/bin/python
+"""
+Work queue:
+----------
+
+SQLite backed queue holding the status of every study in a run so that a run
+can be resumed after a crash without reprocessing finished studies, studies
+can be claimed by concurrent workers and failed studies can be retried with
+backoff or on their own. The batch code passed to create_in_hdx is kept in the
+queue so that it is the same across resumed runs.
+
+"""
+
+import logging
+import sqlite3
+import time
+from os import remove
+from os.path import exists
+
+from hdx.utilities.uuid import get_uuid
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+FETCHED = "fetched"
+GENERATED = "generated"
+UPLOADED = "uploaded"
+SKIPPED = "skipped"
+FAILED = "failed"
+FINISHED = (UPLOADED, SKIPPED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    changed TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    claimed_by TEXT,
+    claimed_at REAL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class WorkQueue:
+    def __init__(self, path, max_attempts=3, backoff=60, claim_timeout=600):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.claim_timeout = claim_timeout
+        self.worker = get_uuid()
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        with self.transaction():
+            row = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'batch'"
+            ).fetchone()
+            if row:
+                self.batch = row["value"]
+            else:
+                self.batch = self.new_batch()
+
+    def new_batch(self):
+        batch = get_uuid()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('batch', ?)", (batch,)
+        )
+        return batch
+
+    def has_work(self):
+        """Whether a previous run left studies to process or retry"""
+        row = self.connection.execute(
+            "SELECT COUNT(*) FROM studies WHERE status IN (?, ?, ?) OR (status = ? AND attempts < ?)",
+            (PENDING, FETCHED, GENERATED, FAILED, self.max_attempts),
+        ).fetchone()
+        return row[0] > 0
+
+    def release_claims(self):
+        """Release every claim eg. those left by a process that was killed. Only
+        call before any worker of this run has claimed studies."""
+        self.connection.execute("UPDATE studies SET claimed_by = NULL")
+
+    def reset(self):
+        """Empty the queue and start a new batch"""
+        with self.transaction():
+            self.connection.execute("DELETE FROM studies")
+            self.batch = self.new_batch()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.connection is None:
+            return
+        # Release studies claimed but not processed eg. prefetched ahead
+        self.connection.execute(
+            "UPDATE studies SET claimed_by = NULL WHERE claimed_by = ?", (self.worker,)
+        )
+        self.connection.close()
+        self.connection = None
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    def count(self, status=None, exclude=None):
+        query = "SELECT COUNT(*) FROM studies"
+        params = list()
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        elif exclude:
+            query += f" WHERE status NOT IN ({','.join('?' * len(exclude))})"
+            params.extend(exclude)
+        return self.connection.execute(query, params).fetchone()[0]
+
+    def add(self, dataset_info):
+        """Add a study from the catalog. A study already in the queue is reset
+        to pending if its changed value differs."""
+        now = time.time()
+        with self.transaction():
+            row = self.connection.execute(
+                "SELECT changed FROM studies WHERE id = ?", (dataset_info["id"],)
+            ).fetchone()
+            if row is None:
+                position = self.connection.execute(
+                    "SELECT COALESCE(MAX(position), -1) + 1 FROM studies"
+                ).fetchone()[0]
+                self.connection.execute(
+                    "INSERT INTO studies (id, position, changed, url, status, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        dataset_info["id"],
+                        position,
+                        dataset_info["changed"],
+                        dataset_info["url"],
+                        PENDING,
+                        now,
+                    ),
+                )
+            elif row["changed"] != dataset_info["changed"]:
+                self.connection.execute(
+                    "UPDATE studies SET changed = ?, url = ?, status = ?, attempts = 0, next_attempt = 0, error = NULL, updated = ? WHERE id = ?",
+                    (
+                        dataset_info["changed"],
+                        dataset_info["url"],
+                        PENDING,
+                        now,
+                        dataset_info["id"],
+                    ),
+                )
+
+    def claimable(self, now):
+        return (
+            "(status IN (?, ?, ?) OR (status = ? AND attempts < ? AND next_attempt <= ?))"
+            " AND (claimed_by IS NULL OR claimed_at < ?)",
+            [
+                PENDING,
+                FETCHED,
+                GENERATED,
+                FAILED,
+                self.max_attempts,
+                now,
+                now - self.claim_timeout,
+            ],
+        )
+
+    def claim(self, dataset_id=None):
+        """Claim the given study or, if None, the first study that is due. Returns
+        the study's dataset info or None if it cannot be claimed."""
+        now = time.time()
+        condition, params = self.claimable(now)
+        query = f"SELECT id, changed, url FROM studies WHERE {condition}"
+        if dataset_id is not None:
+            query += " AND id = ?"
+            params.append(dataset_id)
+        query += " ORDER BY status = ?, position LIMIT 1"
+        params.append(FAILED)
+        with self.transaction():
+            row = self.connection.execute(query, params).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE studies SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                (self.worker, now, row["id"]),
+            )
+        return {"id": row["id"], "changed": row["changed"], "url": row["url"]}
+
+    def claim_each(self, dataset_infos):
+        """Add each study in dataset_infos, which can be a lazy iterable, to the
+        queue passing through only those this worker claims"""
+        for dataset_info in dataset_infos:
+            self.add(dataset_info)
+            if self.claim(dataset_info["id"]):
+                yield dataset_info
+
+    def set_status(self, dataset_id, status):
+        self.connection.execute(
+            "UPDATE studies SET status = ?, updated = ? WHERE id = ?",
+            (status, time.time(), dataset_id),
+        )
+
+    def finish(self, dataset_id, status):
+        self.connection.execute(
+            "UPDATE studies SET status = ?, error = NULL, claimed_by = NULL, updated = ? WHERE id = ?",
+            (status, time.time(), dataset_id),
+        )
+
+    def fail(self, dataset_id, error, retry=True):
+        """Mark a study as failed releasing it. Unless retry is False, it can be
+        claimed again after a backoff that doubles with each attempt."""
+        now = time.time()
+        with self.transaction():
+            attempts = self.connection.execute(
+                "SELECT attempts FROM studies WHERE id = ?", (dataset_id,)
+            ).fetchone()[0]
+            attempts = attempts + 1 if retry else self.max_attempts
+            next_attempt = now + self.backoff * 2 ** (attempts - 1)
+            self.connection.execute(
+                "UPDATE studies SET status = ?, attempts = ?, next_attempt = ?, error = ?, claimed_by = NULL, updated = ? WHERE id = ?",
+                (FAILED, attempts, next_attempt, error, now, dataset_id),
+            )
+
+    def next_retry(self):
+        """Seconds until the next failed study can be retried or None"""
+        row = self.connection.execute(
+            "SELECT MIN(next_attempt) FROM studies WHERE status = ? AND attempts < ?",
+            (FAILED, self.max_attempts),
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0)
+
+    def get_failed(self):
+        return [
+            dict(x)
+            for x in self.connection.execute(
+                "SELECT id, url, attempts, error FROM studies WHERE status = ? ORDER BY position",
+                (FAILED,),
+            )
+        ]
+
+    def reset_failed(self):
+        """Allow all failed studies to be retried immediately"""
+        self.connection.execute(
+            "UPDATE studies SET attempts = 0, next_attempt = 0 WHERE status = ?",
+            (FAILED,),
+        )
+
+    def is_finished(self):
+        return self.count(exclude=FINISHED) == 0
+
+    def delete(self):
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if exists(f"{self.path}{suffix}"):
+                remove(f"{self.path}{suffix}")
+
+
+class Transaction:
+    """Immediate transaction so concurrent workers serialise their claims"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.execute("COMMIT")
+        else:
+            self.connection.execute("ROLLBACK")
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+"""
+Writer:
+------
+
+Uploads datasets to HDX in a pool of writer threads so that HDX round trips
+overlap rather than add up. The number of unreported uploads is bounded, which
+holds back dataset generation when HDX is the bottleneck, and the outcome and
+errors of each upload are reported on the calling thread in the order that
+datasets were submitted so that runs log and record state deterministically.
+
+"""
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from traceback import format_exc
+
+logger = logging.getLogger(__name__)
+
+
+def pool_session(session, size):
+    """Allow size concurrent connections per host on session keeping the
+    retry configuration of its adapters"""
+    from requests.adapters import HTTPAdapter
+
+    for prefix, adapter in list(session.adapters.items()):
+        if not isinstance(adapter, HTTPAdapter):
+            # eg. the file:// adapter of HDX sessions
+            continue
+        session.mount(
+            prefix,
+            HTTPAdapter(
+                pool_connections=size,
+                pool_maxsize=size,
+                max_retries=adapter.max_retries,
+            ),
+        )
+
+
+class ErrorBuffer:
+    """Holds the errors of an upload until it is reported"""
+
+    def __init__(self):
+        self.errors = list()
+
+    def add(self, *args, **kwargs):
+        self.errors.append((args, kwargs))
+
+    def report(self, errors):
+        for args, kwargs in self.errors:
+            errors.add(*args, **kwargs)
+
+
+class UploadPool:
+    def __init__(self, uploader, writers=4, max_in_flight=8, session=None):
+        self.uploader = uploader
+        self.max_in_flight = max(max_in_flight, writers)
+        if session is not None and writers > 1:
+            pool_session(session, writers)
+        self.executor = ThreadPoolExecutor(
+            max_workers=writers, thread_name_prefix="upload"
+        )
+        self.pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        try:
+            self.join()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def submit(self, dataset_info, dataset, batch, callback):
+        """Upload dataset calling callback with whether it succeeded once it is
+        reported. Blocks while max_in_flight uploads are unreported."""
+        self.report()
+        while len(self.pending) >= self.max_in_flight:
+            self.report_next()
+        errors = ErrorBuffer()
+        future = self.executor.submit(
+            self.uploader.upload, dataset_info, dataset, batch, errors
+        )
+        self.pending.append((future, dataset_info, errors, callback))
+
+    def report_next(self):
+        future, dataset_info, errors, callback = self.pending.popleft()
+        try:
+            uploaded = future.result()
+        except Exception:
+            url = dataset_info["url"]
+            logger.exception(f"Error uploading dataset: {url}!")
+            errors.add(f"Dataset: {url}, error: {format_exc()}")
+            uploaded = False
+        errors.report(self.uploader.errors)
+        callback(uploaded)
+
+    def report(self, block=False):
+        """Report finished uploads up to the first unfinished one or, if block
+        is True, all uploads"""
+        while self.pending and (block or self.pending[0][0].done()):
+            self.report_next()
+
+    def join(self):
+        self.report(block=True)
@@ -0,0 +1,35 @@
+"""
+Fixtures shared by the unit tests.
+
+"""
+
+from os.path import join
+
+import pytest
+
+from hdx.api.configuration import Configuration
+
+
+class Errors:
+    """Collects error messages in place of ErrorHandler"""
+
+    def __init__(self):
+        self.errors = list()
+
+    def add(self, message):
+        self.errors.append(message)
+
+
+@pytest.fixture(scope="function")
+def configuration():
+    Configuration._create(
+        user_agent="test",
+        hdx_key="12345",
+        project_config_yaml=join("tests", "config", "project_configuration.yaml"),
+    )
+    return Configuration.read()
+
+
+@pytest.fixture(scope="function")
+def errors():
+    return Errors()
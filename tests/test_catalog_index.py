@@ -0,0 +1,122 @@
+#!/usr/bin/python
+"""
+Unit tests for the catalog index.
+
+"""
+
+import json
+from os.path import join
+
+import pytest
+
+from hdx.location.country import Country
+from hdx.scraper.unhcr.microdata import __main__ as microdata
+from hdx.scraper.unhcr.microdata.catalog_index import CatalogIndex, iter_documents
+from hdx.scraper.unhcr.microdata.httpcache import CachingDownload
+from hdx.scraper.unhcr.microdata.snapshot import SnapshotRecorder
+
+base_url = "https://microdata.unhcr.org/index.php/"
+configuration = {
+    "catalog_url": "api/catalog/",
+    "metadata_url": "metadata/export/{}/json",
+}
+catalog = {
+    "found": 3,
+    "result": [
+        {"id": "187", "idno": "UNHCR-AFG", "changed": "Dec-05-2019", "url": "u187"},
+        {"id": "272", "idno": "UNHCR-PHL", "changed": "Sep-28-2020", "url": "u272"},
+        {"id": "300", "idno": "UNHCR-ATL", "changed": "Jan-10-2021", "url": "u300"},
+    ],
+}
+
+
+class Response:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+
+class Download:
+    def __init__(self):
+        documents = {f"{base_url}api/catalog/latest": json.dumps(catalog).encode()}
+        for dataset_id in ("187", "272"):
+            with open(
+                join("tests", "fixtures", f"metadata_{dataset_id}.json"), "rb"
+            ) as f:
+                documents[f"{base_url}metadata/export/{dataset_id}/json"] = f.read()
+        metadata = json.loads(documents[f"{base_url}metadata/export/272/json"])
+        metadata["study_desc"]["study_info"]["nation"] = [
+            {"name": "Atlantis", "abbreviation": ""}
+        ]
+        documents[f"{base_url}metadata/export/300/json"] = json.dumps(metadata).encode()
+        self.documents = documents
+
+    def download(self, url, **kwargs):
+        return Response(self.documents[url])
+
+
+class TestCatalogIndex:
+    @pytest.fixture(scope="class", autouse=True)
+    @classmethod
+    def countries(cls):
+        Country.countriesdata(use_live=False)
+
+    def check_index(self, path, source):
+        with CatalogIndex(path) as index:
+            assert index.build(iter_documents(source), configuration) == 3
+            studies = index.search("refugees AND afghanistan")
+            assert [x["id"] for x in studies] == ["187"]
+            assert studies[0]["idno"] == "UNHCR-AFG-2017-SEA_KhostPaktika-1.1"
+            assert studies[0]["iso3s"] == "AFG"
+            assert studies[0]["start_date"] == "2017-05-11"
+            assert studies[0]["end_date"] == "2017-05-29"
+            studies = index.without_country()
+            assert [(x["id"], x["nations"]) for x in studies] == [("300", "Atlantis")]
+            studies = index.changed_since("2020-09-01")
+            assert [(x["id"], x["changed_date"]) for x in studies] == [
+                ("272", "2020-09-28"),
+                ("300", "2021-01-10"),
+            ]
+            with pytest.raises(ValueError):
+                index.changed_since("lala")
+
+    def test_snapshot(self, tmp_path):
+        downloader = Download()
+        path = join(tmp_path, "snapshot.zip")
+        with SnapshotRecorder(downloader, path) as recorder:
+            for url in downloader.documents:
+                recorder.download(url)
+        self.check_index(join(tmp_path, "index.sqlite"), path)
+
+    def test_http_cache(self, tmp_path):
+        downloader = Download()
+        folder = join(tmp_path, "cache")
+        with CachingDownload(downloader, folder, 1000000, {}) as cache:
+            for url in downloader.documents:
+                cache.download(url)
+        path = join(tmp_path, "index.sqlite")
+        self.check_index(path, folder)
+        # Rebuilding replaces the index
+        self.check_index(path, folder)
+
+    def test_inspect(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.setenv("TEMP_DIR", str(tmp_path))
+        # Nothing has been downloaded to index
+        with pytest.raises(SystemExit) as excinfo:
+            microdata.inspect(["--search", "refugees"])
+        assert excinfo.value.code == 1
+        downloader = Download()
+        folder = join(tmp_path, "UNHCR-MICRODATA-HTTP-CACHE")
+        with CachingDownload(downloader, folder, 1000000, {}) as cache:
+            for url in downloader.documents:
+                cache.download(url)
+        # The index is built on first use
+        microdata.inspect(["--search", "refugees AND afghanistan"])
+        assert capsys.readouterr().out.split("\t")[:2] == [
+            "187",
+            "UNHCR-AFG-2017-SEA_KhostPaktika-1.1",
+        ]
+        microdata.inspect(["--no-country"])
+        assert capsys.readouterr().out.split("\t")[0] == "300"
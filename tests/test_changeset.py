@@ -0,0 +1,38 @@
+#!/usr/bin/python
+"""
+Unit tests for dry run changesets.
+
+"""
+
+from os.path import join
+
+from hdx.scraper.unhcr.microdata.changeset import Changeset
+from hdx.utilities.loader import load_text
+
+
+class TestChangeset:
+    def test_changeset(self, tmp_path):
+        previous_path = join(tmp_path, "previous.jsonl")
+        with Changeset(previous_path) as changeset:
+            changeset.add("UNHCR-1", "create", "unhcr-1")
+            changeset.add("UNHCR-2", "unchanged", "unhcr-2")
+            changeset.add("UNHCR-3", "unchanged", "unhcr-3")
+        path = join(tmp_path, "changeset.jsonl")
+        with Changeset(path) as changeset:
+            changeset.add("UNHCR-1", "create", "unhcr-1")
+            changeset.add("UNHCR-2", "update", "unhcr-2", ["title", "tags"])
+            changeset.add("UNHCR-4", "missing_from_catalog")
+        assert changeset.counts == {
+            "create": 1,
+            "update": 1,
+            "unchanged": 0,
+            "missing_from_catalog": 1,
+        }
+        assert load_text(path).splitlines()[1] == (
+            '{"id":"UNHCR-2","action":"update","name":"unhcr-2","changes":["title","tags"]}'
+        )
+        differences = changeset.compare(previous_path)
+        assert [x[0] for x in differences] == ["UNHCR-2", "UNHCR-3", "UNHCR-4"]
+        assert differences[1][2] is None
+        assert differences[2][1] is None
+        assert changeset.compare(join(tmp_path, "missing.jsonl")) == []
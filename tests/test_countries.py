@@ -0,0 +1,41 @@
+#!/usr/bin/python
+"""
+Unit tests for country resolution.
+
+"""
+
+from os.path import join
+from unittest.mock import patch
+
+import pytest
+
+from hdx.location.country import Country
+from hdx.scraper.unhcr.microdata.countries import CountryResolver
+
+
+class TestCountryResolver:
+    @pytest.fixture(scope="class", autouse=True)
+    @classmethod
+    def countriesdata(cls):
+        Country.countriesdata(use_live=False)
+
+    def test_get_iso3(self, tmp_path):
+        path = join(tmp_path, "country_cache.json")
+        countries = CountryResolver(path)
+        assert countries.get_iso3({"name": "Kenya", "abbreviation": "KEN"}) == "KEN"
+        assert countries.get_iso3({"name": "", "abbreviation": ""}) is None
+        assert countries.fuzzy_matches == 0
+        for _ in range(3):
+            nation = {"name": "Islamic Republic of Afghanistan", "abbreviation": ""}
+            assert countries.get_iso3(nation, "https://lala/1") == "AFG"
+            nation = {"name": "Atlantis", "abbreviation": ""}
+            assert countries.get_iso3(nation, "https://lala/2") is None
+        assert countries.fuzzy_matches == 2
+        assert countries.misses == {"Atlantis": {"https://lala/2"}}
+        countries.save()
+
+        countries = CountryResolver(path)
+        with patch.object(Country, "get_iso3_country_code_fuzzy") as fuzzy:
+            nation = {"name": "Islamic Republic of Afghanistan", "abbreviation": ""}
+            assert countries.get_iso3(nation) == "AFG"
+            fuzzy.assert_not_called()
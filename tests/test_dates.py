@@ -0,0 +1,47 @@
+#!/usr/bin/python
+"""
+Unit tests for collection date parsing.
+
+"""
+
+from datetime import datetime, timezone
+
+from hdx.scraper.unhcr.microdata.dates import get_collection_period, parse_date
+from hdx.utilities.dateparse import parse_date_range
+
+
+class TestDates:
+    def test_parse_date(self):
+        for text in ("2019", "2019-05", "2019-02", "2020-02", "2019-05-17", "2019-5"):
+            assert parse_date(text) == parse_date_range(text)
+        # dateutil fallback
+        assert parse_date("May 2019") == parse_date_range("May 2019")
+        assert parse_date("17/05/2019") == parse_date_range("17/05/2019")
+        assert parse_date("") is None
+        assert parse_date("2019-13") is None
+        assert parse_date("2019-02-30") is None
+        # zero components are rejected like parse_date_range does
+        assert parse_date("2017-00") is None
+        assert parse_date("2017-05-00") is None
+        assert parse_date("unknown") is None
+
+    def test_get_collection_period(self):
+        def date(year, month, day):
+            return datetime(year, month, day, tzinfo=timezone.utc)
+
+        assert get_collection_period(
+            [{"start": "2017-05-11", "end": "2017-05-29", "cycle": ""}]
+        ) == (date(2017, 5, 11), date(2017, 5, 29))
+        assert get_collection_period(
+            [
+                {"start": "2018-03", "end": "2018-04"},
+                {"start": "2017-05-11", "end": "bad"},
+                {"start": "", "end": ""},
+            ]
+        ) == (date(2017, 5, 11), date(2018, 4, 30))
+        assert get_collection_period([{"end": "2016"}]) == (
+            date(2016, 1, 1),
+            date(2016, 12, 31),
+        )
+        assert get_collection_period([{"start": "bad", "end": ""}]) is None
+        assert get_collection_period([]) is None
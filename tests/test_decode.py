@@ -0,0 +1,32 @@
+#!/usr/bin/python
+"""
+Unit tests for decoding metadata exports.
+
+"""
+
+from os.path import join
+
+import pytest
+
+from hdx.scraper.unhcr.microdata import decode
+from hdx.utilities.loader import load_json
+
+
+class TestDecode:
+    @pytest.mark.parametrize("backend", ["msgspec", "orjson", "json"])
+    def test_decode_metadata(self, monkeypatch, backend):
+        if backend != "json":
+            pytest.importorskip(backend)
+        monkeypatch.setattr(decode, "backend", backend)
+        path = join("tests", "fixtures", "metadata_187.json")
+        with open(path, "rb") as f:
+            metadata = decode.decode_metadata(f.read())
+        study_desc = load_json(path)["study_desc"]
+        assert metadata == {
+            "study_desc": {
+                "title_statement": study_desc["title_statement"],
+                "authoring_entity": study_desc["authoring_entity"],
+                "study_info": study_desc["study_info"],
+                "method": {"data_collection": study_desc["method"]["data_collection"]},
+            }
+        }
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+"""
+Unit tests for the generation cache.
+
+"""
+
+import json
+from os.path import join
+from unittest.mock import patch
+
+import pytest
+
+from hdx.data.dataset import Dataset
+from hdx.data.resource import Resource
+from hdx.scraper.unhcr.microdata.decode import decode_metadata
+from hdx.scraper.unhcr.microdata.generationcache import (
+    GenerationCache,
+    get_generation_hash,
+    get_release,
+)
+from hdx.scraper.unhcr.microdata.pipeline import Pipeline
+from hdx.utilities.loader import load_json
+
+
+class TestGenerationCache:
+    dataset_info = {
+        "id": "187",
+        "changed": "Dec-05-2019",
+        "url": "https://microdata.unhcr.org/index.php/catalog/187",
+    }
+
+    @pytest.fixture(scope="function")
+    def document(self):
+        return load_json(join("tests", "fixtures", "metadata_187.json"))
+
+    def test_get_generation_hash(self, configuration):
+        assert "dev" not in get_release()
+        generation = get_generation_hash(configuration)
+        assert get_generation_hash(configuration) == generation
+        configuration["auth_url"] = "lala/{}"
+        assert get_generation_hash(configuration) != generation
+
+    def test_get_key(self, configuration, tmp_path, document):
+        cache = GenerationCache(tmp_path, configuration)
+        metadata = decode_metadata(json.dumps(document).encode("utf-8"))
+        key = cache.get_key(self.dataset_info, metadata)
+        # the study's changed value does not change the key
+        dataset_info = {**self.dataset_info, "changed": "Sep-28-2020"}
+        assert cache.get_key(dataset_info, metadata) == key
+        # parts of the metadata that are not used do not change the key
+        document["doc_desc"] = {"producers": [{"name": "Someone else"}]}
+        metadata = decode_metadata(json.dumps(document).encode("utf-8"))
+        assert cache.get_key(self.dataset_info, metadata) == key
+        configuration["auth_url"] = "lala/{}"
+        assert (
+            GenerationCache(tmp_path, configuration).get_key(
+                self.dataset_info, metadata
+            )
+            != key
+        )
+        document["study_desc"]["study_info"]["abstract"] = "Changed"
+        metadata = decode_metadata(json.dumps(document).encode("utf-8"))
+        assert cache.get_key(self.dataset_info, metadata) != key
+
+    def test_generate_dataset(self, configuration, tmp_path, document, errors):
+        dataset = Dataset({"name": "unhcr-187", "title": "Test"})
+        resource = Resource(
+            {"name": "Codebook", "url": "https://lala", "format": "pdf"}
+        )
+        resource.set_date_data_updated(self.dataset_info["changed"])
+        dataset.add_update_resource(resource)
+        cache = GenerationCache(tmp_path, configuration)
+        unhcr = Pipeline(configuration, None, cache=cache)
+        metadata = decode_metadata(json.dumps(document).encode("utf-8"))
+        with patch.object(Pipeline, "build_dataset") as build_dataset:
+            build_dataset.return_value = dataset
+            unhcr.generate_dataset(self.dataset_info, errors, metadata)
+            cached = unhcr.generate_dataset(self.dataset_info, errors, metadata)
+            assert build_dataset.call_count == 1
+            assert cached.get_dataset_dict() == dataset.get_dataset_dict()
+            assert unhcr.metrics.get_count("generation_cache_hits") == 1
+            # a study changed upstream in parts of its metadata that are not
+            # used gets the cached dataset dated by its new changed value
+            dataset_info = {**self.dataset_info, "changed": "Sep-28-2020"}
+            cached = unhcr.generate_dataset(dataset_info, errors, metadata)
+            assert build_dataset.call_count == 1
+            assert cached["title"] == "Test"
+            resource = cached.get_resources()[0]
+            assert resource["last_modified"] == "2020-09-28T00:00:00.000000"
+            # failures are not cached
+            build_dataset.return_value = None
+            document["study_desc"]["study_info"]["abstract"] = "Changed"
+            metadata = decode_metadata(json.dumps(document).encode("utf-8"))
+            for _ in range(2):
+                assert unhcr.generate_dataset(dataset_info, errors, metadata) is None
+            assert build_dataset.call_count == 3
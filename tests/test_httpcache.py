@@ -0,0 +1,105 @@
+#!/usr/bin/python
+"""
+Unit tests for the HTTP cache.
+
+"""
+
+import json
+
+from hdx.scraper.unhcr.microdata.httpcache import CachingDownload
+
+
+class Response:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class Download:
+    def __init__(self):
+        self.requests = list()
+
+    def download(self, url, **kwargs):
+        headers = kwargs.get("headers") or {}
+        self.requests.append((url, headers))
+        if headers.get("If-None-Match") == '"v1"':
+            return Response(304)
+        content = json.dumps({"url": url}).encode("utf-8")
+        return Response(200, content, {"ETag": '"v1"'})
+
+
+class TestCachingDownload:
+    def test_revalidation(self, tmp_path):
+        downloader = Download()
+        url = "https://lala/metadata/export/187/json"
+        with CachingDownload(downloader, tmp_path, 1000, {}) as cache:
+            assert cache.download(url).json() == {"url": url}
+            assert cache.download(url).json() == {"url": url}
+        assert downloader.requests == [
+            (url, {}),
+            (url, {"If-None-Match": '"v1"'}),
+        ]
+        # the index persists so a rerun also revalidates
+        with CachingDownload(downloader, tmp_path, 1000, {}) as cache:
+            assert cache.download(url).json() == {"url": url}
+            assert cache.revalidated == 1
+
+    def test_ttl(self, tmp_path):
+        downloader = Download()
+        ttls = {"metadata/export/": 3600}
+        with CachingDownload(downloader, tmp_path, 1000, ttls) as cache:
+            url = "https://lala/metadata/export/187/json"
+            cache.download(url)
+            assert cache.download(url).json() == {"url": url}
+            assert cache.hits == 1
+            url = "https://lala/api/catalog/latest"
+            cache.download(url)
+            cache.download(url)
+            assert cache.hits == 1
+        assert len(downloader.requests) == 3
+
+    def test_eviction(self, tmp_path):
+        downloader = Download()
+        with CachingDownload(downloader, tmp_path, 100, {}) as cache:
+            for i in range(5):
+                cache.download(f"https://lala/metadata/export/{i}/json")
+            # each document is 45 bytes so only the 2 most recent fit
+            assert sorted(cache.index) == [
+                "https://lala/metadata/export/3/json",
+                "https://lala/metadata/export/4/json",
+            ]
+
+    def test_version(self, tmp_path):
+        downloader = Download()
+        ttls = {"metadata/export/": 3600}
+        url = "https://lala/metadata/export/187/json"
+        with CachingDownload(downloader, tmp_path, 1000, ttls) as cache:
+            cache.download(url, version="Dec-05-2019")
+            cache.download(url, version="Dec-05-2019")
+            assert cache.hits == 1
+            # the study changed so the document is revalidated within its ttl
+            cache.download(url, version="Sep-28-2020")
+            assert cache.revalidated == 1
+            assert cache.index[url]["version"] == "Sep-28-2020"
+            cache.download(url, version="Sep-28-2020")
+            assert cache.hits == 2
+        assert downloader.requests == [
+            (url, {}),
+            (url, {"If-None-Match": '"v1"'}),
+        ]
+
+    def test_save_every(self, tmp_path):
+        downloader = Download()
+        index_path = tmp_path / "index.json"
+        with CachingDownload(downloader, tmp_path, 1000, {}, save_every=2) as cache:
+            cache.download("https://lala/metadata/export/1/json")
+            assert not index_path.exists()
+            cache.download("https://lala/metadata/export/2/json")
+            assert len(json.loads(index_path.read_text())) == 2
+            cache.download("https://lala/metadata/export/3/json")
+            assert len(json.loads(index_path.read_text())) == 2
+        assert len(json.loads(index_path.read_text())) == 3
@@ -0,0 +1,37 @@
+#!/usr/bin/python
+"""
+Unit tests that the entry point starts without importing heavy modules.
+
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+DEFERRED = (
+    "hdx.api.configuration",
+    "hdx.data.dataset",
+    "hdx.location.country",
+    "dateutil.parser",
+    "slugify",
+    "frictionless",
+)
+
+
+class TestImports:
+    @pytest.mark.parametrize(
+        "module",
+        [
+            "hdx.scraper.unhcr.microdata.__main__",
+            "hdx.scraper.unhcr.microdata.pipeline",
+        ],
+    )
+    def test_deferred_imports(self, module):
+        script = f"import sys, {module}; print(' '.join(sys.modules))"
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, check=True, text=True
+        ).stdout
+        modules = set(output.split())
+        assert module in modules
+        assert [x for x in DEFERRED if x in modules] == []
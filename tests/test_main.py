@@ -0,0 +1,248 @@
+#!/usr/bin/python
+"""
+End to end tests of processing runs offline from a snapshot of the fixtures.
+
+"""
+
+import json
+import logging
+from os.path import exists, join
+from unittest.mock import patch
+
+import pytest
+
+from hdx.api.locations import Locations
+from hdx.data.dataset import Dataset
+from hdx.data.vocabulary import Vocabulary
+from hdx.location.country import Country
+from hdx.scraper.unhcr.microdata import __main__ as microdata
+from hdx.scraper.unhcr.microdata.changeset import Changeset
+from hdx.scraper.unhcr.microdata.countries import CountryResolver
+from hdx.scraper.unhcr.microdata.metrics import Metrics
+from hdx.scraper.unhcr.microdata.snapshot import SnapshotRecorder, SnapshotReplay
+from hdx.scraper.unhcr.microdata.state import StudyState
+from hdx.scraper.unhcr.microdata.workqueue import WorkQueue
+from hdx.utilities.base_downloader import DownloadError
+from hdx.utilities.error_handler import ErrorHandler
+from hdx.utilities.loader import load_yaml
+from hdx.utilities.path import get_temp_dir
+
+project_config_yaml = join(
+    "src",
+    "hdx",
+    "scraper",
+    "unhcr",
+    "microdata",
+    "config",
+    "project_configuration.yaml",
+)
+base_url = "https://microdata.unhcr.org/index.php/"
+catalog = {
+    "found": 2,
+    "result": [
+        {
+            "id": "187",
+            "idno": "UNHCR-AFG-2017-SEA_KhostPaktika-1.1",
+            "changed": "Dec-05-2019",
+            "url": f"{base_url}catalog/187",
+        },
+        {
+            "id": "272",
+            "idno": "UNHCR_PHL_2016_Zamboanga_HB_IDP_Profiling",
+            "changed": "Sep-28-2020",
+            "url": f"{base_url}catalog/272",
+        },
+    ],
+}
+
+
+class Response:
+    def __init__(self, content):
+        self.content = content
+
+
+class Download:
+    def __init__(self):
+        self.documents = {
+            f"{base_url}api/catalog/latest?limit=500&offset=0": json.dumps(
+                catalog
+            ).encode("utf-8")
+        }
+        for dataset_id in ("187", "272"):
+            path = join("tests", "fixtures", f"metadata_{dataset_id}.json")
+            with open(path, "rb") as f:
+                self.documents[f"{base_url}metadata/export/{dataset_id}/json"] = (
+                    f.read()
+                )
+
+    def download(self, url, **kwargs):
+        return Response(self.documents[url])
+
+
+class FlakyReplay(SnapshotReplay):
+    """Replay that fails the first download of each url in failures"""
+
+    def __init__(self, path, failures):
+        super().__init__(path)
+        self.failures = set(failures)
+
+    def download(self, url, **kwargs):
+        if url in self.failures:
+            self.failures.remove(url)
+            raise DownloadError(f"Failed to download {url}!")
+        return super().download(url, **kwargs)
+
+
+class TestMain:
+    @pytest.fixture(scope="function")
+    def configuration(self, configuration, tmp_path, monkeypatch):
+        # Runs need the rate limits, caches and queue of the package's
+        # configuration
+        configuration.update(load_yaml(project_config_yaml))
+        Locations.set_validlocations(
+            [
+                {"name": "afg", "title": "Afghanistan"},
+                {"name": "phl", "title": "Philippines"},
+            ]
+        )
+        Country.countriesdata(use_live=False)
+        # Tag mappings and approved tags are otherwise downloaded
+        Vocabulary.set_tagsdict({"lala": {"Action to Take": "delete"}})
+        Vocabulary._approved_vocabulary = {
+            "id": "4e61d464-4943-4e97-973a-84673c1aaa87",
+            "tags": [{"name": x} for x in ("refugees", "food security", "protection")],
+        }
+        configuration["work_queue"]["backoff"] = 0
+        configuration["generation_cache_folder"] = join(tmp_path, "generation_cache")
+        monkeypatch.setenv("TEMP_DIR", str(tmp_path))
+        yield configuration
+        Vocabulary.set_tagsdict(None)
+        Vocabulary._approved_vocabulary = None
+
+    @pytest.fixture(scope="function")
+    def snapshot(self, tmp_path):
+        downloader = Download()
+        path = join(tmp_path, "snapshot.zip")
+        with SnapshotRecorder(downloader, path) as recorder:
+            for url in downloader.documents:
+                recorder.download(url)
+        return path
+
+    @staticmethod
+    def make_run(configuration, tmp_path, **kwargs):
+        return microdata.Run(
+            configuration,
+            StudyState(join(tmp_path, "study_state.json")),
+            CountryResolver(),
+            Metrics(),
+            ErrorHandler(),
+            **kwargs,
+        )
+
+    def test_replay(self, configuration, tmp_path, snapshot):
+        run = self.make_run(configuration, tmp_path, replay=snapshot)
+        microdata.process(run)
+        assert run.errors.shared_errors["error"] == {}
+        assert run.metrics.get_count("datasets_generated") == 2
+        assert run.metrics.get_count("datasets_created") == 0
+
+    def test_replay_in_workers(self, configuration, tmp_path, snapshot):
+        run = self.make_run(configuration, tmp_path, replay=snapshot, workers=2)
+        microdata.process_in_workers(run)
+        assert run.errors.shared_errors["error"] == {}
+        # metrics are merged from both workers
+        assert run.metrics.get_count("datasets_generated") == 2
+
+    def test_process(self, configuration, tmp_path, snapshot, monkeypatch):
+        url = f"{base_url}metadata/export/187/json"
+        monkeypatch.setattr(
+            microdata,
+            "get_downloader",
+            lambda configuration, stack, *args: stack.enter_context(
+                FlakyReplay(snapshot, [url])
+            ),
+        )
+        queue_path = join(tmp_path, "UNHCR-MICRODATA", "work_queue.sqlite")
+        with patch.object(Dataset, "read_from_hdx") as read_from_hdx, patch.object(
+            Dataset, "create_in_hdx"
+        ) as create_in_hdx:
+            read_from_hdx.return_value = None
+            run = self.make_run(configuration, tmp_path)
+            microdata.process(run)
+            run.state.save()
+            # the failed download is retried
+            assert run.metrics.get_count("download_failures") == 1
+            assert run.metrics.get_count("study_retries") == 1
+            assert run.metrics.get_count("datasets_created") == 2
+            assert create_in_hdx.call_count == 2
+            assert not exists(queue_path)
+            errors = run.errors.shared_errors["error"][""]
+            assert len(errors) == 1
+            assert url in next(iter(errors))
+
+            # unchanged studies are skipped
+            run = self.make_run(configuration, tmp_path)
+            microdata.process(run)
+            assert run.metrics.get_count("unchanged_studies_skipped") == 2
+            assert run.metrics.get_count("datasets_generated") == 0
+            assert create_in_hdx.call_count == 2
+            assert run.errors.shared_errors["error"] == {}
+
+    def test_main_dry_run(self, configuration, tmp_path, snapshot, monkeypatch, caplog):
+        monkeypatch.setattr(
+            microdata,
+            "get_downloader",
+            lambda configuration, stack, *args: stack.enter_context(
+                SnapshotReplay(snapshot)
+            ),
+        )
+        caplog.set_level(logging.INFO)
+        state_path = join(tmp_path, "study_state.json")
+        configuration["state_file"] = state_path
+        configuration["country_cache_file"] = join(tmp_path, "country_cache.json")
+        state = StudyState(state_path)
+        state.record({"id": "999", "changed": "Dec-05-2019"}, "1234")
+        state.save()
+        previous_path = join(tmp_path, "previous.jsonl")
+        path = join(tmp_path, "changeset.jsonl")
+        with patch.object(Dataset, "read_from_hdx") as read_from_hdx, patch.object(
+            Dataset, "create_in_hdx"
+        ) as create_in_hdx:
+            read_from_hdx.return_value = None
+            microdata.main(dry_run=previous_path)
+            changeset = Changeset.load(previous_path)
+            assert {k: v["action"] for k, v in changeset.items()} == {
+                "187": "create",
+                "272": "create",
+                "999": "missing_from_catalog",
+            }
+            microdata.main(dry_run=path, previous_changeset=previous_path)
+            assert Changeset.load(path) == changeset
+            assert f"0 of 3 studies differ from {previous_path}" in caplog.text
+            create_in_hdx.assert_not_called()
+        # dry runs do not record state
+        assert sorted(StudyState(state_path).studies) == ["999"]
+
+    def test_resume_after_crash(self, configuration, tmp_path, snapshot, monkeypatch):
+        monkeypatch.setattr(
+            microdata,
+            "get_downloader",
+            lambda configuration, stack, *args: stack.enter_context(
+                SnapshotReplay(snapshot)
+            ),
+        )
+        queue_path = join(get_temp_dir("UNHCR-MICRODATA"), "work_queue.sqlite")
+        # a killed run leaves a study claimed
+        crashed = WorkQueue(queue_path)
+        for dataset_info in catalog["result"]:
+            crashed.add(dataset_info)
+        assert crashed.claim()["id"] == "187"
+        crashed.connection.close()
+        with patch.object(Dataset, "read_from_hdx") as read_from_hdx, patch.object(
+            Dataset, "create_in_hdx"
+        ):
+            read_from_hdx.return_value = None
+            run = self.make_run(configuration, tmp_path)
+            microdata.process(run)
+        assert run.metrics.get_count("datasets_created") == 2
+        assert not exists(queue_path)
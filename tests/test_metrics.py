@@ -0,0 +1,51 @@
+#!/usr/bin/python
+"""
+Unit tests for run metrics.
+
+"""
+
+from os.path import join
+
+from hdx.scraper.unhcr.microdata.metrics import Metrics
+from hdx.utilities.loader import load_json, load_text
+
+
+class TestMetrics:
+    def test_metrics(self, tmp_path):
+        metrics = Metrics()
+        with metrics.timer("metadata_download"):
+            pass
+        metrics.add_time("metadata_download", 2.0)
+        metrics.add_time("rate_limit_wait", 0.5)
+        metrics.increment("external_datasets_skipped")
+        metrics.increment("external_datasets_skipped", 2)
+        assert metrics.get_count("external_datasets_skipped") == 3
+        assert metrics.get_count("generation_errors") == 0
+
+        path = join(tmp_path, "run_report.json")
+        metrics.save_json(path)
+        report = load_json(path)
+        timer = report["timers"]["metadata_download"]
+        assert timer["count"] == 2
+        assert timer["max"] == 2.0
+        assert 2.0 <= timer["total"] < 2.1
+        assert report["counters"] == {"external_datasets_skipped": 3}
+
+        path = join(tmp_path, "unhcr_microdata.prom")
+        metrics.save_prometheus(path)
+        lines = load_text(path).splitlines()
+        assert "# TYPE unhcr_microdata_rate_limit_wait_seconds_total counter" in lines
+        assert "unhcr_microdata_rate_limit_wait_seconds_total 0.5" in lines
+        assert "unhcr_microdata_metadata_download_total 2" in lines
+        assert "unhcr_microdata_external_datasets_skipped_total 3" in lines
+
+        worker = Metrics()
+        worker.add_time("metadata_download", 3.0)
+        worker.add_time("create_in_hdx", 1.0)
+        worker.increment("external_datasets_skipped")
+        metrics.merge(worker.get_report())
+        report = metrics.get_report()
+        assert report["timers"]["metadata_download"]["count"] == 3
+        assert report["timers"]["metadata_download"]["max"] == 3.0
+        assert report["timers"]["create_in_hdx"]["total"] == 1.0
+        assert report["counters"] == {"external_datasets_skipped": 4}
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+"""
+Unit tests for rate limiting and metadata prefetching.
+
+"""
+
+import threading
+import time
+
+from hdx.scraper.unhcr.microdata.prefetch import MetadataPrefetcher
+from hdx.scraper.unhcr.microdata.ratelimit import RateLimitedDownload, TokenBucket
+
+
+class TestPrefetch:
+    def test_token_bucket(self):
+        bucket = TokenBucket(2, 0.2)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        # 2 tokens available immediately, 2 more refill at 10 per second
+        assert 0.15 < time.monotonic() - start < 0.5
+
+    def test_rate_limited_download(self):
+        class Download:
+            def __init__(self):
+                self.urls = list()
+
+            def download(self, url, **kwargs):
+                self.urls.append(url)
+                return url
+
+        downloader = RateLimitedDownload(
+            Download(),
+            {
+                "default": {"calls": 1, "period": 10},
+                "fast": {"calls": 10, "period": 0.1},
+            },
+        )
+        start = time.monotonic()
+        assert downloader.download("https://slow/1") == "https://slow/1"
+        for i in range(5):
+            downloader.download(f"https://fast/{i}")
+        assert time.monotonic() - start < 1
+        assert sorted(downloader.buckets) == ["fast", "slow"]
+
+    def test_prefetcher(self):
+        fetched = list()
+        lock = threading.Lock()
+
+        def fetch(dataset_info):
+            with lock:
+                fetched.append(dataset_info["id"])
+            return {"id": dataset_info["id"]}
+
+        dataset_infos = ({"id": str(i)} for i in range(10))
+        with MetadataPrefetcher(
+            fetch,
+            dataset_infos,
+            workers=2,
+            lookahead=3,
+            should_fetch=lambda x: x["id"] != "2",
+        ) as prefetcher:
+            ids = list()
+            for dataset_info in prefetcher:
+                dataset_id = dataset_info["id"]
+                ids.append(dataset_id)
+                # simulate resuming part way through
+                if dataset_id in ("0", "6", "7"):
+                    assert prefetcher.get(dataset_info) == {"id": dataset_id}
+            assert prefetcher.get({"id": "other"}) == {"id": "other"}
+        assert ids == [str(i) for i in range(10)]
+        fetched = set(fetched)
+        assert {"0", "1", "6", "7", "other"} <= fetched
+        assert not {"2", "5"} & fetched
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+"""
+Unit tests for adaptive rate limiting against a local stub server.
+
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+
+import pytest
+
+from hdx.scraper.unhcr.microdata.metrics import Metrics
+from hdx.scraper.unhcr.microdata.ratelimit import (
+    FileTokenBucket,
+    RateLimitedDownload,
+    TokenBucket,
+    leave_status_retries,
+)
+from hdx.utilities.base_downloader import DownloadError
+from hdx.utilities.downloader import Download
+
+retry = {
+    "attempts": 2,
+    "backoff": 0.01,
+    "max_backoff": 0.05,
+    "statuses": [429, 500, 502, 503, 504],
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Statuses and headers to return for each path before succeeding
+    failures = dict()
+    requests = list()
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        failures = self.failures.get(self.path)
+        if failures:
+            status, headers = failures.pop(0)
+        else:
+            status, headers = 200, dict()
+        body = b"{}" if status == 200 else b"error"
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRateLimit:
+    @pytest.fixture(scope="class")
+    @classmethod
+    def server(cls):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+        server.server_close()
+
+    @pytest.fixture(scope="function")
+    def downloader(self, server):
+        Handler.failures = dict()
+        Handler.requests = list()
+        with Download(user_agent="test") as downloader:
+            leave_status_retries(downloader.session)
+            yield downloader
+
+    def test_aimd(self):
+        bucket = TokenBucket(1, 1, min_calls=0.5, max_calls=2, increase=0.4)
+        bucket.succeeded()
+        assert bucket.rate == pytest.approx(1.4)
+        bucket.succeeded()
+        bucket.succeeded()
+        assert bucket.rate == 2
+        bucket.throttled()
+        assert bucket.rate == 2
+        bucket = TokenBucket(1, 1, min_calls=0.5, max_calls=2, decrease=0.5)
+        bucket.throttled()
+        bucket.throttled()
+        assert bucket.rate == 0.5
+        # Without bounds the rate is fixed
+        bucket = TokenBucket(1, 1)
+        bucket.succeeded()
+        bucket.throttled()
+        assert bucket.rate == 1
+
+    def test_file_aimd(self, tmp_path):
+        path = join(tmp_path, "127.0.0.1.json")
+        first = FileTokenBucket(path, 10, 1, min_calls=5, max_calls=20, decrease=0.5)
+        second = FileTokenBucket(path, 10, 1, min_calls=5, max_calls=20)
+        first.throttled(0.2)
+        # the rate and pause are shared
+        assert second.rate == 5
+        assert second.acquire() > 0.1
+
+    def test_retry(self, server, downloader):
+        rate_limits = {
+            "default": {
+                "calls": 10,
+                "period": 0.1,
+                "min_calls": 1,
+                "max_calls": 100,
+                "increase": 1,
+                "decrease": 0.5,
+            }
+        }
+        metrics = Metrics()
+        limited = RateLimitedDownload(downloader, rate_limits, metrics, retry=retry)
+        Handler.failures["/throttled"] = [(429, {"Retry-After": "1"})]
+        Handler.failures["/unavailable"] = [(503, dict()), (502, dict())]
+        start = time.monotonic()
+        assert limited.download(f"{server}/throttled").json() == {}
+        # Retry-After is honoured
+        assert time.monotonic() - start >= 1
+        bucket = limited.buckets["127.0.0.1"]
+        assert bucket.rate == pytest.approx(60)
+        assert limited.download(f"{server}/unavailable").json() == {}
+        assert bucket.rate == pytest.approx(25)
+        assert Handler.requests == ["/throttled"] * 2 + ["/unavailable"] * 3
+        assert metrics.get_count("download_retries") == 3
+
+        # Client errors are not retried
+        Handler.failures["/missing"] = [(404, dict())]
+        with pytest.raises(DownloadError):
+            limited.download(f"{server}/missing")
+        assert Handler.requests[-1:] == ["/missing"]
+        # Retries are limited
+        Handler.failures["/down"] = [(500, dict())] * 3
+        with pytest.raises(DownloadError):
+            limited.download(f"{server}/down")
+        assert Handler.requests.count("/down") == 3
+        assert bucket.rate == pytest.approx(10)
+        limited.close()
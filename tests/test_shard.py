@@ -0,0 +1,48 @@
+#!/usr/bin/python
+"""
+Unit tests for sharding and shared rate limits.
+
+"""
+
+from os.path import join
+
+import pytest
+
+from hdx.scraper.unhcr.microdata.ratelimit import FileTokenBucket
+from hdx.scraper.unhcr.microdata.shard import in_shard, parse_shard
+
+
+class TestShard:
+    def test_parse_shard(self):
+        assert parse_shard("0/4") == (0, 4)
+        assert parse_shard("3/4") == (3, 4)
+        with pytest.raises(ValueError):
+            parse_shard("4/4")
+        with pytest.raises(ValueError):
+            parse_shard("1")
+        with pytest.raises(ValueError):
+            parse_shard("a/b")
+
+    def test_in_shard(self):
+        dataset_ids = [f"UNHCR-{i}" for i in range(1000)]
+        shards = [[x for x in dataset_ids if in_shard(x, [(i, 4)])] for i in range(4)]
+        assert sum(len(x) for x in shards) == 1000
+        assert all(200 < len(x) < 300 for x in shards)
+        # stable across calls
+        assert shards[0] == [x for x in dataset_ids if in_shard(x, [(0, 4)])]
+        # workers split their shard between them
+        workers = [
+            [x for x in dataset_ids if in_shard(x, [(0, 4), (i, 2)])] for i in range(2)
+        ]
+        assert sorted(workers[0] + workers[1]) == sorted(shards[0])
+        assert all(len(x) > 75 for x in workers)
+
+    def test_file_token_bucket(self, tmp_path):
+        path = join(tmp_path, "microdata.unhcr.org.json")
+        first = FileTokenBucket(path, 2, 100)
+        second = FileTokenBucket(path, 2, 100)
+        assert first.acquire() == 0
+        assert second.acquire() == 0
+        # tokens are shared so both buckets are now empty
+        third = FileTokenBucket(path, 2, 0.02)
+        assert third.acquire() > 0
@@ -0,0 +1,44 @@
+#!/usr/bin/python
+"""
+Unit tests for recording and replaying snapshots.
+
+"""
+
+from os.path import join
+
+import pytest
+
+from hdx.scraper.unhcr.microdata.snapshot import SnapshotRecorder, SnapshotReplay
+from hdx.utilities.base_downloader import DownloadError
+
+
+class Response:
+    def __init__(self, content):
+        self.content = content
+
+
+class Download:
+    def __init__(self):
+        self.urls = list()
+
+    def download(self, url, **kwargs):
+        self.urls.append(url)
+        return Response(f'{{"url": "{url}"}}'.encode("utf-8"))
+
+
+class TestSnapshot:
+    def test_record_replay(self, tmp_path):
+        path = join(tmp_path, "snapshot.zip")
+        downloader = Download()
+        urls = [f"https://lala/metadata/export/{i}/json" for i in range(3)]
+        with SnapshotRecorder(downloader, path) as recorder:
+            for url in urls:
+                assert recorder.download(url).content == f'{{"url": "{url}"}}'.encode()
+            recorder.download(urls[0])
+        assert len(downloader.urls) == 4
+
+        with SnapshotReplay(path) as replay:
+            for url in urls:
+                assert replay.download(url).json() == {"url": url}
+            with pytest.raises(DownloadError):
+                replay.download("https://lala/metadata/export/4/json")
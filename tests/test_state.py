@@ -0,0 +1,71 @@
+#!/usr/bin/python
+"""
+Unit tests for study state.
+
+"""
+
+from os.path import join
+
+import pytest
+
+from hdx.data.dataset import Dataset
+from hdx.data.resource import Resource
+from hdx.scraper.unhcr.microdata.state import StudyState
+
+
+class TestStudyState:
+    @pytest.fixture(scope="function")
+    def dataset(self, configuration):
+        dataset = Dataset({"name": "unhcr-test", "title": "Test"})
+        resource = Resource(
+            {"name": "Codebook", "url": "https://lala/catalog/1", "format": "pdf"}
+        )
+        dataset.add_update_resource(resource)
+        return dataset
+
+    def test_state(self, tmp_path, dataset):
+        path = join(tmp_path, "study_state.json")
+        dataset_info = {"id": "1", "changed": "Dec-05-2019", "url": "https://lala/1"}
+        state = StudyState(path)
+        assert state.is_unchanged(dataset_info) is False
+        dataset_hash = StudyState.hash_dataset(dataset)
+        assert state.has_hash(dataset_info, dataset_hash) is False
+        state.record(dataset_info, dataset_hash)
+        state.save()
+
+        state = StudyState(path)
+        assert state.is_unchanged(dataset_info) is True
+        assert state.has_hash(dataset_info, dataset_hash) is True
+        assert state.is_unchanged({**dataset_info, "changed": "Sep-28-2020"}) is False
+
+        dataset["title"] = "Changed"
+        assert state.has_hash(dataset_info, StudyState.hash_dataset(dataset)) is False
+
+    def test_save_merges(self, tmp_path, dataset):
+        path = join(tmp_path, "study_state.json")
+        dataset_hash = StudyState.hash_dataset(dataset)
+        first = StudyState(path)
+        second = StudyState(path)
+        first.record({"id": "1", "changed": "Dec-05-2019"}, dataset_hash)
+        first.save()
+        second.record({"id": "2", "changed": "Sep-28-2020"}, dataset_hash)
+        second.save()
+        state = StudyState(path)
+        assert sorted(state.studies) == ["1", "2"]
+
+    def test_generation(self, tmp_path, dataset):
+        path = join(tmp_path, "study_state.json")
+        dataset_info = {"id": "1", "changed": "Dec-05-2019", "url": "https://lala/1"}
+        dataset_hash = StudyState.hash_dataset(dataset)
+        state = StudyState(path, "release-1", save_interval=0)
+        state.record(dataset_info, dataset_hash)
+        # saved on recording as the save interval has passed
+        state = StudyState(path, "release-1")
+        assert state.is_unchanged(dataset_info) is True
+        # generated by a different release or configuration
+        state = StudyState(path, "release-2", save_interval=3600)
+        assert state.is_unchanged(dataset_info) is False
+        state.record({"id": "2", "changed": "Sep-28-2020"}, dataset_hash)
+        assert sorted(StudyState(path).studies) == ["1"]
+        state.save()
+        assert sorted(StudyState(path).studies) == ["1", "2"]
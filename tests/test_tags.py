@@ -0,0 +1,45 @@
+#!/usr/bin/python
+"""
+Unit tests for tag tokenizing.
+
+"""
+
+from hdx.scraper.unhcr.microdata.tags import get_tags, tokenize_tags
+
+
+class TestTags:
+    def test_tokenize_tags(self):
+        assert tokenize_tags(" Livelihood & Social cohesion") == (
+            "livelihood",
+            "social cohesion",
+        )
+        assert tokenize_tags("Housing, Land and Property") == (
+            "housing",
+            "land",
+            "property",
+        )
+        assert tokenize_tags("Domestic Needs/Household Support") == (
+            "domestic needs",
+            "household support",
+        )
+        assert tokenize_tags("Health and other") == ("health",)
+        # words merely containing "and" or "other" are not split
+        assert tokenize_tags("Standards & Mothers") == ("standards", "mothers")
+        assert tokenize_tags("Wash, R&D / Other") == ("wash", "r&d")
+        assert tokenize_tags("Cash-and-voucher assistance/other") == (
+            "cash-and-voucher assistance",
+        )
+
+    def test_get_tags(self):
+        study_info = {
+            "topics": [{"topic": "Protection"}, {"topic": "Emergency Shelter and NFI"}],
+            "keywords": [{"keyword": "Refugees"}],
+        }
+        assert get_tags(study_info) == [
+            "protection",
+            "emergency shelter",
+            "nfi",
+            "refugees",
+        ]
+        del study_info["keywords"]
+        assert get_tags(study_info) == ["protection", "emergency shelter", "nfi"]
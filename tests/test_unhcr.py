@@ -12,11 +12,10 @@ from hdx.api.configuration import Configuration
 from hdx.api.locations import Locations
 from hdx.location.country import Country
 from hdx.scraper.unhcr.microdata.pipeline import Pipeline
-from hdx.utilities.loader import load_json
 
 dataset_ids_json = {
-    "limit": 10000,
-    "found": 85,
+    "limit": 500,
+    "found": 2,
     "result": [
         {
             "id": "187",
@@ -38,8 +37,10 @@ dataset_ids_json = {
         },
     ],
 }
-metadata_187 = load_json(join("tests", "fixtures", "metadata_187.json"))
-metadata_272 = load_json(join("tests", "fixtures", "metadata_272.json"))
+with open(join("tests", "fixtures", "metadata_187.json"), "rb") as f:
+    metadata_187 = f.read()
+with open(join("tests", "fixtures", "metadata_272.json"), "rb") as f:
+    metadata_272 = f.read()
 
 
 class TestUNHCR:
@@ -62,32 +63,26 @@ class TestUNHCR:
     @pytest.fixture(scope="function")
     def downloader(self):
         class Response:
+            content = None
+
             @staticmethod
             def json():
                 pass
 
         class Download:
             @staticmethod
-            def download(url):
+            def download(url, **kwargs):
                 response = Response()
-                if "limit=10000" in url:
+                if "api/catalog/latest" in url:
 
                     def fn():
                         return dataset_ids_json
 
                     response.json = fn
                 elif "187" in url:
-
-                    def fn():
-                        return metadata_187
-
-                    response.json = fn
+                    response.content = metadata_187
                 elif "272" in url:
-
-                    def fn():
-                        return metadata_272
-
-                    response.json = fn
+                    response.content = metadata_272
                 return response
 
         return Download()
@@ -110,6 +105,42 @@ class TestUNHCR:
             },
         ]
 
+    def test_iter_dataset_info_paging(self, configuration):
+        class Response:
+            def __init__(self, json):
+                self._json = json
+
+            def json(self):
+                return self._json
+
+        class Download:
+            def __init__(self, ignore_offset):
+                self.ignore_offset = ignore_offset
+                self.urls = list()
+
+            def download(self, url, **kwargs):
+                self.urls.append(url)
+                offset = 0
+                if not self.ignore_offset:
+                    offset = int(url.split("offset=")[1])
+                results = dataset_ids_json["result"][offset : offset + 1]
+                return Response({"found": 2, "result": results})
+
+        configuration["catalog_page_size"] = 1
+        downloader = Download(False)
+        unhcr = Pipeline(configuration, downloader)
+        assert [x["id"] for x in unhcr.iter_dataset_info()] == ["187", "272"]
+        assert downloader.urls == [
+            "https://lala/index.php/api/catalog/latest?limit=1&offset=0",
+            "https://lala/index.php/api/catalog/latest?limit=1&offset=1",
+        ]
+        # offset being ignored upstream fails rather than truncating the catalog
+        downloader = Download(True)
+        unhcr = Pipeline(configuration, downloader)
+        with pytest.raises(ValueError, match="only 1 of 2 seen"):
+            list(unhcr.iter_dataset_info())
+        assert len(downloader.urls) == 2
+
     def test_generate_dataset(self, unhcr):
         dataset = unhcr.generate_dataset(
             {
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+"""
+Unit tests for uploading to HDX.
+
+"""
+
+from os.path import join
+from unittest.mock import patch
+
+from hdx.data.dataset import Dataset
+from hdx.data.resource import Resource
+from hdx.scraper.unhcr.microdata.changeset import Changeset
+from hdx.scraper.unhcr.microdata.state import StudyState
+from hdx.scraper.unhcr.microdata.upload import Uploader, diff_dataset
+
+
+class TestUpload:
+    dataset_info = {"id": "1", "changed": "Dec-05-2019", "url": "https://lala/1"}
+
+    @staticmethod
+    def make_dataset(title, last_modified="2019-12-05T00:00:00.000000"):
+        dataset = Dataset(
+            {
+                "name": "unhcr-test",
+                "title": title,
+                "groups": [{"name": "afg"}],
+                "tags": [{"name": "refugees", "vocabulary_id": "1234"}],
+            }
+        )
+        resource = Resource(
+            {
+                "name": "Codebook",
+                "url": "https://lala/catalog/1",
+                "format": "pdf",
+                "last_modified": last_modified,
+            }
+        )
+        dataset.add_update_resource(resource)
+        return dataset
+
+    def test_diff_dataset(self, configuration):
+        dataset = self.make_dataset("Test")
+        existing = self.make_dataset("Test", "2019-12-05T00:00:00")
+        existing["id"] = "abcd"
+        existing["groups"] = [{"name": "afg", "title": "Afghanistan", "id": "1"}]
+        assert diff_dataset(dataset, existing) == []
+        existing = self.make_dataset("Old", "2019-12-04T00:00:00")
+        assert diff_dataset(dataset, existing) == [
+            "title",
+            "resources[0].last_modified",
+        ]
+
+    def test_upload(self, configuration, tmp_path, errors):
+        state = StudyState(join(tmp_path, "study_state.json"))
+        uploader = Uploader(state, errors)
+        dataset = self.make_dataset("Test")
+        with patch.object(Dataset, "read_from_hdx") as read_from_hdx, patch.object(
+            Dataset, "create_in_hdx"
+        ) as create_in_hdx:
+            # not in state and identical in HDX so nothing is written
+            read_from_hdx.return_value = self.make_dataset("Test")
+            assert uploader.upload(self.dataset_info, dataset, "batch") is True
+            create_in_hdx.assert_not_called()
+            # recorded in state so HDX is not consulted
+            read_from_hdx.reset_mock()
+            assert uploader.upload(self.dataset_info, dataset, "batch") is True
+            read_from_hdx.assert_not_called()
+            create_in_hdx.assert_not_called()
+            # changed since last recorded so written
+            dataset = self.make_dataset("New")
+            assert uploader.upload(self.dataset_info, dataset, "batch") is True
+            read_from_hdx.assert_not_called()
+            create_in_hdx.assert_called_once()
+            assert create_in_hdx.call_args.kwargs["batch"] == "batch"
+        assert uploader.metrics.counters == {
+            "datasets_created": 1,
+            "datasets_unaltered": 2,
+        }
+        assert uploader.metrics.timers["create_in_hdx"]["count"] == 1
+        assert errors.errors == []
+
+    def test_dry_run(self, configuration, tmp_path, errors):
+        state = StudyState(join(tmp_path, "study_state.json"))
+        path = join(tmp_path, "changeset.jsonl")
+        dataset = self.make_dataset("Test")
+        with Changeset(path) as changeset, patch.object(
+            Dataset, "read_from_hdx"
+        ) as read_from_hdx, patch.object(Dataset, "create_in_hdx") as create_in_hdx:
+            uploader = Uploader(state, errors, changeset=changeset)
+            read_from_hdx.return_value = None
+            assert uploader.upload(self.dataset_info, dataset, "batch") is True
+            read_from_hdx.return_value = self.make_dataset("Old")
+            assert uploader.upload(self.dataset_info, dataset, "batch") is True
+            state.record(self.dataset_info, StudyState.hash_dataset(dataset))
+            read_from_hdx.reset_mock()
+            assert uploader.upload(self.dataset_info, dataset, "batch") is True
+            read_from_hdx.assert_not_called()
+            create_in_hdx.assert_not_called()
+        assert [x["action"] for x in Changeset.load(path).values()] == ["unchanged"]
+        assert changeset.counts == {
+            "create": 1,
+            "update": 1,
+            "unchanged": 1,
+            "missing_from_catalog": 0,
+        }
+        assert errors.errors == []
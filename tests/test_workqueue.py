@@ -0,0 +1,115 @@
+#!/usr/bin/python
+"""
+Unit tests for the work queue.
+
+"""
+
+from os.path import exists, join
+
+from hdx.scraper.unhcr.microdata.workqueue import (
+    FAILED,
+    FETCHED,
+    PENDING,
+    SKIPPED,
+    UPLOADED,
+    WorkQueue,
+)
+
+
+class TestWorkQueue:
+    dataset_infos = [
+        {"id": f"UNHCR-{i}", "changed": "Dec-05-2019", "url": f"https://lala/{i}"}
+        for i in range(4)
+    ]
+
+    def test_resume(self, tmp_path):
+        path = join(tmp_path, "work_queue.sqlite")
+        with WorkQueue(path) as queue:
+            batch = queue.batch
+            claimed = queue.claim_each(self.dataset_infos)
+            assert next(claimed)["id"] == "UNHCR-0"
+            queue.finish("UNHCR-0", UPLOADED)
+            assert next(claimed)["id"] == "UNHCR-1"
+            queue.set_status("UNHCR-1", FETCHED)
+            assert next(claimed)["id"] == "UNHCR-2"
+            queue.fail("UNHCR-2", "error")
+            assert queue.get_failed() == [
+                {
+                    "id": "UNHCR-2",
+                    "url": "https://lala/2",
+                    "attempts": 1,
+                    "error": "error",
+                }
+            ]
+            # crash before UNHCR-3 is added
+
+        with WorkQueue(path) as queue:
+            assert queue.has_work() is True
+            assert queue.batch == batch
+            changed = {**self.dataset_infos[3], "changed": "Sep-28-2020"}
+            claimed = list(queue.claim_each(self.dataset_infos[:3] + [changed]))
+            # finished and failed studies awaiting backoff are not reprocessed
+            assert [x["id"] for x in claimed] == ["UNHCR-1", "UNHCR-3"]
+            queue.finish("UNHCR-1", SKIPPED)
+            queue.finish("UNHCR-3", UPLOADED)
+            assert queue.claim() is None
+            assert 0 < queue.next_retry() <= 120
+            assert queue.is_finished() is False
+
+        # failed studies can be retried on their own
+        with WorkQueue(path) as queue:
+            queue.reset_failed()
+            assert queue.claim()["id"] == "UNHCR-2"
+            assert queue.claim() is None
+            queue.finish("UNHCR-2", UPLOADED)
+            assert queue.is_finished() is True
+            assert queue.has_work() is False
+            queue.delete()
+        assert not exists(path)
+
+    def test_backoff(self):
+        with WorkQueue(":memory:", max_attempts=2, backoff=0) as queue:
+            queue.add(self.dataset_infos[0])
+            queue.add(self.dataset_infos[1])
+            assert queue.claim()["id"] == "UNHCR-0"
+            queue.fail("UNHCR-0", "error")
+            # pending studies come before retries
+            assert queue.claim()["id"] == "UNHCR-1"
+            queue.fail("UNHCR-1", "error", retry=False)
+            assert queue.next_retry() == 0
+            assert queue.claim()["id"] == "UNHCR-0"
+            queue.fail("UNHCR-0", "error")
+            assert queue.claim() is None
+            assert queue.next_retry() is None
+            assert queue.count(FAILED) == 2
+            assert queue.has_work() is False
+            queue.reset()
+            assert queue.count() == 0
+
+    def test_concurrent_workers(self, tmp_path):
+        path = join(tmp_path, "work_queue.sqlite")
+        with WorkQueue(path) as first, WorkQueue(path) as second:
+            assert first.batch == second.batch
+            for dataset_info in self.dataset_infos:
+                first.add(dataset_info)
+            assert first.claim()["id"] == "UNHCR-0"
+            assert second.claim("UNHCR-0") is None
+            assert second.claim()["id"] == "UNHCR-1"
+            assert first.claim()["id"] == "UNHCR-2"
+            assert first.count(PENDING) == 4
+        # claims are released on closing
+        with WorkQueue(path) as queue:
+            assert queue.claim()["id"] == "UNHCR-0"
+
+    def test_release_claims(self, tmp_path):
+        path = join(tmp_path, "work_queue.sqlite")
+        # a killed process leaves its claims
+        crashed = WorkQueue(path)
+        for dataset_info in self.dataset_infos:
+            crashed.add(dataset_info)
+        assert crashed.claim()["id"] == "UNHCR-0"
+        with WorkQueue(path) as queue:
+            assert queue.claim("UNHCR-0") is None
+            queue.release_claims()
+            assert queue.claim("UNHCR-0")["id"] == "UNHCR-0"
+        crashed.connection.close()
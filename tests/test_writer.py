@@ -0,0 +1,93 @@
+#!/usr/bin/python
+"""
+Unit tests for the pool of HDX writers.
+
+"""
+
+import threading
+import time
+
+import pytest
+from requests import Session
+
+from hdx.scraper.unhcr.microdata.writer import UploadPool, pool_session
+from hdx.utilities.session import FileAdapter
+
+
+class FakeUploader:
+    """Stands in for Uploader, taking longer to upload earlier datasets"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def upload(self, dataset_info, dataset, batch, errors):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(dataset["delay"])
+        with self.lock:
+            self.in_flight -= 1
+        if dataset["fail"] == "error":
+            errors.add(f"Dataset: {dataset_info['url']} failed")
+            return False
+        if dataset["fail"] == "exception":
+            raise ValueError("Unexpected")
+        return True
+
+
+class TestUploadPool:
+    def test_upload_pool(self, errors):
+        uploader = FakeUploader(errors)
+        reported = list()
+        with UploadPool(uploader, writers=3, max_in_flight=4) as writer:
+            for i in range(12):
+                dataset_info = {"id": str(i), "url": f"https://lala/{i}"}
+                fail = {4: "error", 7: "exception", 9: "error"}.get(i)
+                dataset = {"delay": (12 - i) * 0.005, "fail": fail}
+                writer.submit(
+                    dataset_info,
+                    dataset,
+                    "batch",
+                    lambda success, i=i: reported.append((i, success)),
+                )
+                # backpressure bounds unreported uploads
+                assert len(writer.pending) <= 4
+        assert uploader.max_in_flight <= 3
+        # reported in submission order despite finishing in reverse
+        assert [x[0] for x in reported] == list(range(12))
+        assert [x[0] for x in reported if not x[1]] == [4, 7, 9]
+        assert errors.errors[0] == "Dataset: https://lala/4 failed"
+        assert errors.errors[1].startswith("Dataset: https://lala/7, error: Traceback")
+        assert errors.errors[2] == "Dataset: https://lala/9 failed"
+
+    def test_join(self, errors):
+        uploader = FakeUploader(errors)
+        reported = list()
+        writer = UploadPool(uploader, writers=2)
+        for i in range(3):
+            writer.submit(
+                {"id": str(i), "url": f"https://lala/{i}"},
+                {"delay": 0.01, "fail": None},
+                "batch",
+                reported.append,
+            )
+        writer.join()
+        assert reported == [True, True, True]
+        assert not writer.pending
+        writer.close()
+        with pytest.raises(RuntimeError):
+            writer.executor.submit(print)
+
+    def test_pool_session(self):
+        session = Session()
+        session.get_adapter("https://lala").max_retries.total = 5
+        file_adapter = FileAdapter()
+        session.mount("file://", file_adapter)
+        pool_session(session, 8)
+        adapter = session.get_adapter("https://lala")
+        assert adapter._pool_maxsize == 8
+        assert adapter.max_retries.total == 5
+        assert session.get_adapter("file:///lala") is file_adapter